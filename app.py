@@ -1,8 +1,8 @@
 from flask import Flask, render_template, jsonify, request, send_from_directory
-import pandas as pd
 import os
-import joblib
 from datetime import datetime
+import database
+from prediction_engine import get_engine, MAX_BATCH_SIZE
 
 app = Flask(__name__, 
             static_folder='static',
@@ -13,10 +13,22 @@ MODEL_PATH = "limit_and_count_predictor.pkl"
 CATEGORIES = ['Food', 'Transport', 'Shopping', 'Utilities', 'Entertainment']
 CSV_PATH = "classified_transactions.csv"
 
-# Create CSV if it doesn't exist
-if not os.path.exists(CSV_PATH):
-    df = pd.DataFrame(columns=["id", "category", "amount", "created_at"])
-    df.to_csv(CSV_PATH, index=False)
+# The model is loaded once and reloaded only when the file changes; without
+# it the engine answers from its fallback table
+prediction_engine = get_engine(MODEL_PATH)
+prediction_engine.registry.get()
+
+# Transactions live in the shared database; import the legacy CSV once
+database.init_db()
+if os.path.exists(CSV_PATH) and database.count_transactions() == 0:
+    database.migrate_transactions_from_csv(CSV_PATH)
+if not database.has_rollups() and database.count_transactions() > 0:
+    database.rebuild_rollups()
+
+# Give the request's database connection back to the pool when it ends
+@app.teardown_request
+def release_db_connection(exc):
+    database.release_connection()
 
 # --- Web Routes ---
 @app.route('/')
@@ -46,28 +58,10 @@ def summary_page():
 # --- API Routes ---
 @app.route("/api/summary", methods=["GET"])
 def summary():
-    transactions = pd.read_csv(CSV_PATH).to_dict(orient="records")
-    now = datetime.now()
-    current_month = now.month
-    current_week = now.isocalendar()[1]  # Week number
-
-    monthly_spent = 0
-    weekly_spent = 0
-    total_trans = len(transactions)
-
-    for txn in transactions:
-        try:
-            date_str = txn.get("created_at", "")
-            if not date_str:
-                continue
-            date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-        except ValueError:
-            continue
-
-        if date_obj.month == current_month and date_obj.year == now.year:
-            monthly_spent += txn["amount"]
-            if date_obj.isocalendar()[1] == current_week:
-                weekly_spent += txn["amount"]
+    year_month, iso_week = database.rollup_period(datetime.now())
+
+    # Read the pre-aggregated rollups instead of scanning every transaction
+    monthly_spent, weekly_spent, total_trans = database.get_rollup_summary(None, year_month, iso_week)
 
     return jsonify({
         "monthly_spent": monthly_spent,
@@ -79,8 +73,7 @@ def summary():
 @app.route("/api/transactions", methods=["GET"])
 def get_transactions():
     try:
-        df = pd.read_csv(CSV_PATH)
-        return jsonify(df.to_dict(orient="records"))
+        return jsonify(database.get_transactions())
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -93,22 +86,9 @@ def add_transaction():
     if not category or not amount:
         return jsonify({"error": "Missing category or amount"}), 400
     
-    # Read existing CSV
-    if os.path.exists(CSV_PATH):
-        df = pd.read_csv(CSV_PATH)
-    else:
-        df = pd.DataFrame(columns=["id", "category", "amount", "created_at"])
-    
-    # Generate new ID
-    new_id = df["id"].max() + 1 if not df.empty else 1
-
-    # Add new transaction
+    # Add new transaction (the database assigns the id and updates the rollups)
     now = datetime.now().strftime("%Y-%m-%d")
-    new_row = {"id": int(new_id), "category": category, "amount": float(amount), "created_at": now}
-    df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-
-    # Save back to CSV
-    df.to_csv(CSV_PATH, index=False)
+    new_row = database.add_transaction({"category": category, "amount": float(amount), "created_at": now})
 
     return jsonify({"message": "Transaction added", "data": new_row})
 
@@ -119,26 +99,48 @@ def predict():
     except:
         return jsonify({"error": "Invalid income value"}), 400
 
-    if os.path.exists(MODEL_PATH):
-        model = joblib.load(MODEL_PATH)
-        
-        results = []
-        for category in CATEGORIES:
-            data = {f'category_{cat}': [1 if cat == category else 0] for cat in CATEGORIES}
-            data['monthly_income'] = [income]
-            input_df = pd.DataFrame(data)
-            ordered_columns = [f'category_{cat}' for cat in sorted(CATEGORIES)] + ['monthly_income']
-            input_df = input_df.reindex(columns=ordered_columns, fill_value=0)
-            prediction = model.predict(input_df)[0]
-            results.append({
-                "category": category,
-                "limit": round(prediction[0], 2),
-                "count": int(round(prediction[1]))
-            })
-
-        return jsonify(results)
-    else:
-        return jsonify({"error": "Model not found"}), 404
+    # All categories are scored in one call, once per income and model version
+    results, etag = prediction_engine.predict(income, CATEGORIES)
+    response = jsonify(results)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+@app.route("/api/predict/batch", methods=["POST"])
+def predict_bulk():
+    """
+    Score many users at once (e.g. nightly budget recomputation).
+
+    Body: {"users": [{"user_id": 1, "income": 50000}, ...]} or {"incomes": [50000, ...]}
+    """
+    data = request.json or {}
+    users = data.get("users")
+    if users is None:
+        users = [{"income": income} for income in data.get("incomes", [])]
+
+    if not users:
+        return jsonify({"error": "Provide users or incomes"}), 400
+    if len(users) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"At most {MAX_BATCH_SIZE} users per request"}), 400
+
+    try:
+        incomes = [float(user["income"]) for user in users]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "Every user needs a numeric income"}), 400
+
+    predictions, mode = prediction_engine.predict_many(incomes, CATEGORIES)
+    results = []
+    for user, income, user_predictions in zip(users, incomes, predictions):
+        result = {"income": income, "predictions": user_predictions}
+        if "user_id" in user:
+            result["user_id"] = user["user_id"]
+        results.append(result)
+
+    return jsonify({"mode": mode, "model_version": prediction_engine.model_version, "results": results})
+
+@app.route("/api/model", methods=["GET"])
+def model_info():
+    return jsonify(prediction_engine.registry.info())
 
 if __name__ == "__main__":
     app.run(debug=True) 
\ No newline at end of file
@@ -1,29 +1,35 @@
-from fastapi import FastAPI, HTTPException, Request, Depends, Header
+from fastapi import FastAPI, HTTPException, Request, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
-import pandas as pd
 import os
 import json
 import hmac
 import hashlib
-import razorpay
 import base64
-from typing import Optional, Dict, Any, List
+import asyncio
+from typing import Optional, Dict
 from datetime import datetime
 import traceback
 
 # Import configuration
 from backend.config import (
-    BASE_DIR, CSV_PATH, MODEL_PATH, 
+    CSV_PATH, MODEL_PATH,
     RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET, RAZORPAY_WEBHOOK_SECRET,
     APP_NAME, CURRENCY
 )
+from backend.store import get_store, close_store
+from backend.aggregates import aggregate_transactions
+from backend.pagination import filter_transactions, paginate_transactions, parse_fields
+from backend.workers import run_blocking, shutdown_executor
+from backend.razorpay_pool import get_client, get_pool, close_pool
+from prediction_engine import get_engine, cached_personal_prediction, etag_matches
+from transaction_classifier import get_classifier
 
 app = FastAPI(title=f"{APP_NAME} API", description="AI-based Expenditure Tracking System")
 
-# Initialize Razorpay client
-razorpay_client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
+# Shared Razorpay client (pooled keep-alive connections, rate limited)
+razorpay_client = get_client(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET)
 
 # Allow requests from frontend
 app.add_middleware(
@@ -39,6 +45,13 @@ data_dir = os.path.dirname(CSV_PATH)
 os.makedirs(data_dir, exist_ok=True)
 print(f"Ensuring data directory exists: {data_dir}")
 
+@app.on_event("shutdown")
+def shutdown_store():
+    # Let queued writes finish, then make sure they reach the disk before the process exits
+    shutdown_executor()
+    close_store()
+    close_pool()
+
 # Data model for transactions
 class Transaction(BaseModel):
     category: str
@@ -82,67 +95,41 @@ async def root():
     return {"message": f"Welcome to {APP_NAME} API"}
 
 @app.get("/transactions")
-async def get_transactions():
-    try:
-        # Define the columns we expect
-        expected_columns = [
-            "category", "amount", "description", "method", 
-            "created_at", "id", "razorpay_payment_id", 
-            "razorpay_order_id", "status"
-        ]
-        
-        # Create a fresh file if any issues are detected
-        create_fresh_file = False
-        
-        # If file doesn't exist or is empty, create a new one
-        if not os.path.exists(CSV_PATH) or os.path.getsize(CSV_PATH) == 0:
-            create_fresh_file = True
-        else:
-            # Try to read the file carefully
-            try:
-                df = pd.read_csv(CSV_PATH, encoding='utf-8')
-                
-                # Check if any required columns are missing
-                for col in expected_columns:
-                    if col not in df.columns:
-                        create_fresh_file = True
-                        break
-                        
-            except Exception as e:
-                print(f"Error reading CSV: {str(e)}")
-                create_fresh_file = True
-        
-        # Create a fresh CSV file if needed
-        if create_fresh_file:
-            print(f"Creating a fresh transaction file at {CSV_PATH}")
-            df = pd.DataFrame(columns=expected_columns)
-            # Ensure the directory exists
-            os.makedirs(os.path.dirname(CSV_PATH), exist_ok=True)
-            df.to_csv(CSV_PATH, index=False, encoding='utf-8')
-            return []
-        
-        # If we get here, we successfully read the file
-        # Make sure id field is present for DataGrid
-        if 'id' not in df.columns or df['id'].isnull().any():
-            df['id'] = range(len(df))
-            
-        # Handle any missing columns to avoid future issues
-        for col in expected_columns:
-            if col not in df.columns:
-                df[col] = None
-                
-        # Clean any problematic values
-        df = df.replace([float('inf'), -float('inf')], 0)
-        df = df.fillna(0)  # Replace NaN with 0 for numeric fields
-        
-        # Save the cleaned DataFrame
-        df.to_csv(CSV_PATH, index=False, encoding='utf-8')
+async def get_transactions(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    category: Optional[str] = None,
+    method: Optional[str] = None,
+    status: Optional[str] = None,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to")
+):
+    def load():
+        # Served from the store's cached, normalized frame; reads never write
+        store = get_store()
+        paginated = limit is not None or cursor is not None
+        filtered = any([category, method, status, date_from, date_to])
+        if not paginated and not filtered and not fields:
+            # The full listing is memoized until the ledger changes
+            return store.records()
         
-        # Convert to JSON-safe records
-        records = df.to_dict(orient="records")
+        df = filter_transactions(store.read_frame(), category, method, status, date_from, date_to)
+        columns = parse_fields(fields, df.columns)
         
-        return records
+        # Without limit/cursor keep returning the plain list older clients expect
+        if not paginated:
+            if columns:
+                df = df[columns]
+            return df.to_dict(orient="records")
         
+        # limit=0 is rejected like any other out of range value
+        return paginate_transactions(df, 50 if limit is None else limit, cursor, columns)
+    
+    try:
+        return await run_blocking(load)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Unexpected error in get_transactions: {str(e)}")
         traceback.print_exc()  # Print full traceback for debugging
@@ -152,54 +139,41 @@ async def get_transactions():
 @app.post("/add-transaction")
 async def add_transaction(transaction: Transaction):
     try:
-        # Define the columns we expect
-        expected_columns = [
-            "category", "amount", "description", "method", 
-            "created_at", "id", "razorpay_payment_id", 
-            "razorpay_order_id", "status"
-        ]
-        
-        # Create or read the DataFrame
-        if os.path.exists(CSV_PATH) and os.path.getsize(CSV_PATH) > 0:
-            try:
-                df = pd.read_csv(CSV_PATH, encoding='utf-8')
-                
-                # Validate and repair DataFrame if needed
-                for col in expected_columns:
-                    if col not in df.columns:
-                        df[col] = None
-                        
-                # Clean any problematic values
-                df = df.replace([float('inf'), -float('inf')], 0)
-                df = df.fillna(0)
-            except Exception as e:
-                print(f"Error reading CSV in add_transaction: {str(e)}")
-                # Create a new DataFrame if reading failed
-                df = pd.DataFrame(columns=expected_columns)
-        else:
-            # Create a new DataFrame if file doesn't exist
-            print(f"Creating a new transaction file at {CSV_PATH}")
-            df = pd.DataFrame(columns=expected_columns)
-            # Ensure directory exists
-            os.makedirs(os.path.dirname(CSV_PATH), exist_ok=True)
-        
-        # Convert transaction to dict and add to DataFrame
-        transaction_dict = transaction.dict()
-        # Generate a new ID if needed
-        transaction_dict['id'] = len(df) if len(df) > 0 else 0
+        record = transaction.dict()
+        if not record["category"].strip() and record["description"]:
+            # Let the classifier pick the category from the description
+            record["category"] = await run_blocking(get_classifier().classify_one, record["description"])
         
-        # Create a single-row DataFrame and append it
-        new_row = pd.DataFrame([transaction_dict])
-        df = pd.concat([df, new_row], ignore_index=True)
-        
-        # Save to CSV
-        df.to_csv(CSV_PATH, index=False, encoding='utf-8')
+        # Append a single row to the transaction log; the store assigns the id
+        await run_blocking(lambda: get_store().append(record))
         return {"message": "Transaction added successfully"}
     except Exception as e:
         print(f"Error in add_transaction: {str(e)}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/aggregates")
+async def get_aggregates(
+    granularity: str = "day",
+    group_by: Optional[str] = None,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to")
+):
+    """Return per-period totals so summary pages don't need the whole ledger."""
+    try:
+        start = datetime.strptime(date_from, "%Y-%m-%d") if date_from else None
+        end = datetime.strptime(date_to, "%Y-%m-%d") if date_to else None
+        series = await run_blocking(
+            lambda: aggregate_transactions(get_store().read_frame(), granularity, group_by, start, end)
+        )
+        return {"granularity": granularity, "group_by": group_by, "series": series}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Error in get_aggregates: {str(e)}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Razorpay specific endpoints
 @app.post("/create-order")
 async def create_order(order_request: OrderRequest):
@@ -215,7 +189,7 @@ async def create_order(order_request: OrderRequest):
             'notes': order_request.notes or {}
         }
         
-        order = razorpay_client.order.create(data=order_data)
+        order = await run_blocking(razorpay_client.order.create, data=order_data)
         
         # Return order details to frontend
         return {
@@ -244,7 +218,7 @@ async def verify_payment(
         razorpay_client.utility.verify_payment_signature(params_dict)
         
         # Get payment details from Razorpay
-        payment = razorpay_client.payment.fetch(payment_id)
+        payment = await run_blocking(razorpay_client.payment.fetch, payment_id)
         
         # Create a transaction record for the payment
         if payment['status'] == 'captured':
@@ -320,16 +294,14 @@ async def razorpay_webhook(
 @app.get("/razorpay-transactions")
 async def get_razorpay_transactions():
     try:
-        # Read transactions from CSV
-        if not os.path.exists(CSV_PATH):
-            return []
-            
-        df = pd.read_csv(CSV_PATH, encoding='utf-8')
-        
-        # Filter transactions with Razorpay payment IDs
-        razorpay_txns = df[df['razorpay_payment_id'].notna()]
+        def build(df):
+            # Filter transactions with Razorpay payment IDs (missing ids are stored as 0)
+            payment_ids = df['razorpay_payment_id'].astype(str)
+            razorpay_txns = df[~payment_ids.isin(["", "0", "0.0"])]
+            return razorpay_txns.to_dict(orient="records")
         
-        return razorpay_txns.to_dict(orient="records")
+        # Memoized until the ledger changes
+        return await run_blocking(lambda: get_store().view("razorpay", build))
     except Exception as e:
         print(f"Error fetching Razorpay transactions: {str(e)}")
         return []
@@ -345,29 +317,25 @@ async def get_razorpay_account():
         
         # Try to fetch account info to verify credentials are valid
         try:
-            client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
+            client = get_client(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET)
+            
+            # Balance and settings don't depend on each other, so fetch them
+            # at the same time; either one may fail (e.g. missing permissions)
+            balance, settings = await asyncio.gather(
+                run_blocking(lambda: client.balance.fetch()),
+                run_blocking(lambda: client.settings.fetch()),
+                return_exceptions=True
+            )
             
-            # Try to make a simple API call to check if credentials are valid
-            # First try to get basic account information
             account_info = {}
-            try:
-                # Attempt to get balance to check API connectivity
-                balance = client.balance.fetch()
-                account_info["has_balance_access"] = True
-            except Exception:
-                # If balance access fails (might be permissions), try a simpler call
-                account_info["has_balance_access"] = False
+            account_info["has_balance_access"] = not isinstance(balance, Exception)
             
-            # Try to get basic account settings
-            try:
-                settings = client.settings.fetch()
+            # If settings access fails, we'll continue with limited info
+            if not isinstance(settings, Exception):
                 if settings and "email" in settings:
                     account_info["email"] = settings["email"]
                 if settings and "business_name" in settings:
                     account_info["business_name"] = settings["business_name"]
-            except Exception:
-                # If settings access fails, we'll continue with limited info
-                pass
                 
             # If we got here without exceptions, the account is connected
             return {
@@ -388,12 +356,17 @@ async def connect_razorpay(credentials: RazorpayCredentials):
     """Connect to Razorpay using API credentials."""
     try:
         # Validate the API credentials by attempting to connect
-        client = razorpay.Client(auth=(credentials.api_key, credentials.api_secret))
+        client = get_client(credentials.api_key, credentials.api_secret)
         
         # Try to make a simple API call to verify credentials
         try:
             # Check if credentials work by making a simple API call
-            settings = client.settings.fetch()
+            try:
+                settings = await run_blocking(lambda: client.settings.fetch())
+            except Exception:
+                # Don't keep a pooled client for rejected credentials
+                get_pool().discard(credentials.api_key, credentials.api_secret)
+                raise
             
             # Store the credentials in .env file or database
             # For simplicity in this example, we'll update environment variables
@@ -417,7 +390,7 @@ async def connect_razorpay(credentials: RazorpayCredentials):
                 
                 # Update the razorpay client with new credentials
                 global razorpay_client
-                razorpay_client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
+                razorpay_client = client
                 
                 # Return account details
                 account_info = {}
@@ -462,7 +435,7 @@ async def disconnect_razorpay():
             
             # Update the razorpay client with default credentials
             global razorpay_client
-            razorpay_client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
+            razorpay_client = get_client(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET)
             
             return {"success": True, "message": "Razorpay account disconnected successfully"}
         else:
@@ -480,8 +453,8 @@ async def test_razorpay_connection():
             
         # Try to make a simple API call
         try:
-            client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
-            settings = client.settings.fetch()
+            client = get_client(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET)
+            settings = await run_blocking(lambda: client.settings.fetch())
             return {
                 "connected": True, 
                 "message": "Successfully connected to Razorpay API",
@@ -493,30 +466,41 @@ async def test_razorpay_connection():
     except Exception as e:
         return {"connected": False, "message": f"Error testing Razorpay connection: {str(e)}"}
 
+def predict_from_history(income_value):
+    """Personal predictions from the store's month x category totals."""
+    # Maintained as transactions are appended, so this never rescans the ledger
+    stamp, history = get_store().monthly_totals()
+    return cached_personal_prediction("ledger", stamp, lambda: history, income_value)
+
 @app.get("/predict-limits")
-async def predict_limits(income: float):
+async def predict_limits(
+    income: float,
+    mode: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None)
+):
     try:
         # Make sure income is positive
         income_value = float(income)
         if income_value <= 0:
             raise HTTPException(status_code=400, detail="Income must be greater than 0")
         
-        print(f"Processing prediction request for income: {income_value}")
-        
-        # Use fallback predictions directly
-        # This avoids the scikit-learn version compatibility issues
-        categories = ['Food', 'Transport', 'Shopping', 'Utilities', 'Entertainment']
-        percentages = [0.3, 0.15, 0.2, 0.25, 0.1]  # 30%, 15%, etc.
+        if mode == "personal":
+            # Fitted to this ledger's own monthly spending per category
+            results, etag = await run_blocking(predict_from_history, income_value)
+        elif mode is None:
+            # Model-backed when the model loads and works, otherwise the fallback
+            # table (which also covers scikit-learn version mismatches)
+            results, etag = await run_blocking(get_engine(MODEL_PATH).predict, income_value)
+        else:
+            raise HTTPException(status_code=400, detail="mode must be 'personal' or omitted")
+        predictions = [[row["category"], row["limit"], row["count"]] for row in results]
         
-        predictions = []
-        for i, category in enumerate(categories):
-            limit = income_value * percentages[i]
-            count = 15 - (i * 3)  # Decreasing counts: 15, 12, 9, 6, 3
-            predictions.append([category, limit, count])
+        # Let clients revalidate with If-None-Match instead of re-downloading
+        headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
         
-        print(f"Generated predictions: {predictions}")
-                
-        return {"predictions": predictions}
+        return JSONResponse(content={"predictions": predictions}, headers=headers)
     except HTTPException:
         # Re-raise HTTP exceptions as they already have status codes
         raise
@@ -17,4 +17,24 @@ RAZORPAY_WEBHOOK_SECRET = os.getenv("RAZORPAY_WEBHOOK_SECRET", "yourhmacsecret")
 
 # Application settings
 APP_NAME = "FinFlow"
-CURRENCY = "INR" 
\ No newline at end of file
+CURRENCY = "INR"
+
+# Transaction store settings
+TRANSACTION_STORE = os.getenv("FINFLOW_TRANSACTION_STORE", "csv")
+STORE_FSYNC_INTERVAL = float(os.getenv("FINFLOW_STORE_FSYNC_INTERVAL", "1.0"))  # seconds between batched fsyncs
+STORE_COMPACT_THRESHOLD = int(os.getenv("FINFLOW_STORE_COMPACT_THRESHOLD", "1000"))  # appended rows before compaction
+STORE_ID_BLOCK_SIZE = int(os.getenv("FINFLOW_STORE_ID_BLOCK_SIZE", "1"))  # ids reserved per sequence file update; >1 keeps ids increasing only within each process
+STORE_GROUP_COMMIT = os.getenv("FINFLOW_STORE_GROUP_COMMIT", "0") == "1"  # fsync each batch of concurrent inserts before returning
+STORE_GROUP_COMMIT_WINDOW = float(os.getenv("FINFLOW_STORE_GROUP_COMMIT_WINDOW", "0.002"))  # seconds to gather a batch
+
+# Worker threads for blocking storage and Razorpay calls made by the API
+IO_WORKERS = int(os.getenv("FINFLOW_IO_WORKERS", "8"))
+
+# Razorpay API client pool
+RAZORPAY_BASE_URL = os.getenv("RAZORPAY_BASE_URL") or None  # e.g. a backend/fake_razorpay.py server; None for the SDK's own
+RAZORPAY_RATE_LIMIT = float(os.getenv("FINFLOW_RAZORPAY_RATE_LIMIT", "10"))  # requests per second per account
+RAZORPAY_BURST = int(os.getenv("FINFLOW_RAZORPAY_BURST", "20"))  # requests allowed back to back
+RAZORPAY_MAX_RETRIES = int(os.getenv("FINFLOW_RAZORPAY_MAX_RETRIES", "4"))
+RAZORPAY_BACKOFF = float(os.getenv("FINFLOW_RAZORPAY_BACKOFF", "0.5"))  # seconds before the first retry, doubled each time
+RAZORPAY_MAX_BACKOFF = float(os.getenv("FINFLOW_RAZORPAY_MAX_BACKOFF", "8"))
+RAZORPAY_TIMEOUT = float(os.getenv("FINFLOW_RAZORPAY_TIMEOUT", "10"))  # seconds per HTTP request
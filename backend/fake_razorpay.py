@@ -0,0 +1,239 @@
+"""
+Local stand-in for the Razorpay API, for offline development and load tests.
+
+Serves the endpoints FinFlow uses (payments list and fetch, order creation)
+from generated data over HTTP/1.1 keep-alive, with optional added
+latency and its own requests-per-second limit that answers 429 like the real
+API. Routes are served with and without the /v1 prefix: the pinned razorpay
+1.x SDK keeps /v1 in its base URL and requests bare paths (/payments), while
+2.x appends /v1/payments to it. Point the backend at it with
+RAZORPAY_BASE_URL=http://127.0.0.1:8765, or run
+
+    python -m backend.fake_razorpay --bench 2000 --concurrency 16
+
+to compare pooled clients against a new razorpay.Client per call.
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+DESCRIPTIONS = ["Swiggy order", "Uber ride", "Amazon purchase", "Electricity bill", "Netflix subscription", "Payment"]
+
+
+class FakeRazorpay:
+    """In-memory Razorpay account data plus the fake server's knobs."""
+
+    def __init__(self, payments=1000, latency=0.0, rate_limit=0, seed=42):
+        self.latency = latency
+        self.rate_limit = rate_limit  # requests per second, 0 for no limit
+        self.lock = threading.Lock()
+        self.orders = {}
+        self.requests = 0
+        self.throttled = 0
+        self._window = (0, 0)  # (second, requests in it)
+
+        rng = random.Random(seed)
+        now = int(time.time())
+        self.payments = sorted(
+            (
+                {
+                    "id": f"pay_fake{i:08d}",
+                    "entity": "payment",
+                    "amount": rng.randint(50, 5000) * 100,
+                    "currency": "INR",
+                    "status": "captured",
+                    "description": rng.choice(DESCRIPTIONS),
+                    "notes": {},
+                    "created_at": now - i * 600
+                }
+                for i in range(payments)
+            ),
+            key=lambda p: -p["created_at"]
+        )
+        self.payments_by_id = {p["id"]: p for p in self.payments}
+
+    def admit(self):
+        """Count a request; False if it is over the rate limit."""
+        with self.lock:
+            self.requests += 1
+            if not self.rate_limit:
+                return True
+            second = int(time.monotonic())
+            start, count = self._window
+            count = count + 1 if start == second else 1
+            self._window = (second, count)
+            if count > self.rate_limit:
+                self.throttled += 1
+                return False
+            return True
+
+    def list_payments(self, query):
+        since = int(query.get("from", 0))
+        until = int(query.get("to", 0)) or None
+        count = min(int(query.get("count", 10)), 100)
+        skip = int(query.get("skip", 0))
+        items = [p for p in self.payments if p["created_at"] >= since and (until is None or p["created_at"] <= until)]
+        items = items[skip:skip + count]
+        return {"entity": "collection", "count": len(items), "items": items}
+
+    def create_order(self, data):
+        with self.lock:
+            order_id = f"order_fake{len(self.orders):08d}"
+            order = {
+                "id": order_id,
+                "entity": "order",
+                "amount": int(data.get("amount", 0)),
+                "currency": data.get("currency", "INR"),
+                "receipt": data.get("receipt"),
+                "status": "created",
+                "notes": data.get("notes") or {},
+                "created_at": int(time.time())
+            }
+            self.orders[order_id] = order
+        return order
+
+
+def _error(status, code, description):
+    return status, {"error": {"code": code, "description": description}}
+
+
+class FakeRazorpayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep connections open between requests
+    disable_nagle_algorithm = True  # headers and body are separate writes
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw_body = self.rfile.read(length) if length else b""
+
+        if not self.fake.admit():
+            self._send(429, {"error": {"code": "BAD_REQUEST_ERROR", "description": "Too many requests"}},
+                       {"Retry-After": "1"})
+            return
+        if self.fake.latency:
+            time.sleep(self.fake.latency)
+        if not self.headers.get("Authorization", "").startswith("Basic "):
+            self._send(*_error(401, "BAD_REQUEST_ERROR", "Authentication failed"))
+            return
+
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        path = url.path.rstrip("/")
+        if path == "/v1" or path.startswith("/v1/"):
+            path = path[len("/v1"):]
+
+        if method == "GET" and path == "/payments":
+            self._send(200, self.fake.list_payments(query))
+        elif method == "GET" and re.fullmatch(r"/payments/[\w]+", path):
+            payment = self.fake.payments_by_id.get(path.rsplit("/", 1)[1])
+            if payment:
+                self._send(200, payment)
+            else:
+                self._send(*_error(400, "BAD_REQUEST_ERROR", "The id provided does not exist"))
+        elif method == "POST" and path == "/orders":
+            try:
+                data = json.loads(raw_body or b"{}")
+            except ValueError:
+                self._send(*_error(400, "BAD_REQUEST_ERROR", "Invalid JSON"))
+                return
+            self._send(200, self.fake.create_order(data))
+        else:
+            self._send(*_error(404, "BAD_REQUEST_ERROR", "The requested URL was not found on the server."))
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+
+def start_fake_server(host="127.0.0.1", port=0, **options):
+    """Start a fake server in a daemon thread; returns (server, base_url)."""
+    server = ThreadingHTTPServer((host, port), FakeRazorpayHandler)
+    server.daemon_threads = True
+    server.fake = FakeRazorpay(**options)
+    threading.Thread(target=server.serve_forever, name="fake-razorpay", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def _bench(name, make_client, calls, concurrency, payment_ids):
+    def call(i):
+        make_client().payment.fetch(payment_ids[i % len(payment_ids)])
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(call, range(calls)))
+    elapsed = time.perf_counter() - started
+    print(f"{name}: {calls} calls in {elapsed:.2f}s ({calls / elapsed:.0f} req/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Razorpay API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--payments", type=int, default=1000, help="generated payments")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--rate-limit", type=int, default=0, help="requests per second before answering 429")
+    parser.add_argument("--bench", type=int, default=0, help="run this many payment fetches and exit")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--client-rate", type=float, default=0,
+                        help="pooled client's token bucket rate for --bench, 0 for no limit")
+    args = parser.parse_args()
+
+    server, base_url = start_fake_server(args.host, args.port, payments=args.payments,
+                                         latency=args.latency, rate_limit=args.rate_limit)
+    print(f"Fake Razorpay API listening on {base_url}")
+
+    if not args.bench:
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        server.shutdown()
+        return
+
+    import razorpay
+    from backend.razorpay_pool import RazorpayClientPool
+
+    auth = ("rzp_test_fake", "fake_secret")
+    payment_ids = [p["id"] for p in server.fake.payments]
+    _bench("new client per call",
+           lambda: razorpay.Client(auth=auth, base_url=base_url),
+           args.bench, args.concurrency, payment_ids)
+
+    pool = RazorpayClientPool(base_url=base_url, rate=args.client_rate)
+    _bench("pooled client",
+           lambda: pool.get_client(*auth),
+           args.bench, args.concurrency, payment_ids)
+    print(f"Pool: {pool.stats()}")
+    print(f"Server: {server.fake.requests} requests, {server.fake.throttled} throttled")
+    pool.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
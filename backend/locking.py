@@ -0,0 +1,44 @@
+"""
+Cross-process file locks for the FinFlow data files.
+
+The Flask app, the FastAPI backend and the scheduled scripts can all touch
+the same files, so writers serialize on an exclusive lock held on a
+companion ".lock" file.
+"""
+
+import os
+from contextlib import contextmanager
+
+if os.name == "nt":
+    import msvcrt
+
+    def _lock(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+    def _unlock(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def _unlock(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on path + ".lock" for the duration of the block."""
+    lock_path = path + ".lock"
+    directory = os.path.dirname(lock_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(lock_path, "a+") as f:
+        _lock(f)
+        try:
+            yield
+        finally:
+            _unlock(f)
@@ -0,0 +1,96 @@
+"""
+Filtering, projection and keyset pagination of transaction frames.
+
+Pages are ordered newest first by (created_at, id). The cursor holds the
+(created_at, id) of the last row of the previous page, so fetching the next
+page never depends on how many rows came before it.
+"""
+
+import base64
+import json
+
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(created_at, txn_id):
+    """Pack a (created_at, id) position into an opaque URL-safe token."""
+    raw = json.dumps([str(created_at), int(txn_id)]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Unpack a token produced by encode_cursor."""
+    try:
+        created_at, txn_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(created_at), int(txn_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def parse_fields(fields, available):
+    """Turn a comma separated fields= value into a column list (id is always kept)."""
+    if not fields:
+        return None
+    columns = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in columns if name not in available]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    if "id" not in columns:
+        columns.insert(0, "id")
+    return columns
+
+
+def filter_transactions(df, category=None, method=None, status=None, start=None, end=None):
+    """Keep rows matching the given values; start/end are inclusive YYYY-MM-DD dates."""
+    mask = df["id"].notna()
+    if category:
+        mask &= df["category"].astype(str) == category
+    if method:
+        mask &= df["method"].astype(str) == method
+    if status:
+        mask &= df["status"].astype(str) == status
+    if start or end:
+        dates = df["created_at"].astype(str).str[:10]
+        if start:
+            mask &= dates >= start
+        if end:
+            mask &= dates <= end
+    return df[mask]
+
+
+def paginate_transactions(df, limit, cursor=None, columns=None):
+    """Return one page of df (newest first) and the cursor for the next page."""
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+    total = len(df)
+    created_at = df["created_at"].astype(str)
+    ids = df["id"].astype(int)
+
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        after = (created_at < cursor_created_at) | ((created_at == cursor_created_at) & (ids < cursor_id))
+        df, created_at, ids = df[after], created_at[after], ids[after]
+
+    order = (
+        df.assign(_created_at=created_at, _id=ids)
+        .sort_values(["_created_at", "_id"], ascending=False)
+        .head(limit + 1)
+    )
+    has_more = len(order) > limit
+    page = order.head(limit)
+
+    next_cursor = None
+    if has_more:
+        last = page.iloc[-1]
+        next_cursor = encode_cursor(last["_created_at"], last["_id"])
+
+    page = page.drop(columns=["_created_at", "_id"])
+    if columns:
+        page = page[columns]
+
+    return {
+        "items": page.to_dict(orient="records"),
+        "next_cursor": next_cursor,
+        "total": total
+    }
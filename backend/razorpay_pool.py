@@ -0,0 +1,207 @@
+"""
+Shared Razorpay API clients for the backend.
+
+A razorpay.Client is cheap to use but not to create: each one builds its own
+requests.Session, so a client per call means a fresh TCP and TLS handshake
+per call. The pool keeps one client per set of credentials, all sharing one
+keep-alive session per account (sized to the I/O worker pool so concurrent
+calls each get a connection).
+
+Every request made through that session first takes a token from the
+account's token bucket (RAZORPAY_RATE_LIMIT per second, bursts of
+RAZORPAY_BURST). Rate-limited (429) responses are retried after Retry-After
+or an exponential backoff with jitter; 5xx responses, connection errors and
+timeouts are retried the same way for GET requests only, so a payment or
+order is never created twice.
+"""
+
+import random
+import threading
+import time
+
+import razorpay
+import requests
+from requests.adapters import HTTPAdapter
+
+from backend.config import (
+    IO_WORKERS, RAZORPAY_BASE_URL, RAZORPAY_RATE_LIMIT, RAZORPAY_BURST,
+    RAZORPAY_MAX_RETRIES, RAZORPAY_BACKOFF, RAZORPAY_MAX_BACKOFF, RAZORPAY_TIMEOUT
+)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Allow rate requests per second on average, up to capacity at once."""
+
+    def __init__(self, rate=RAZORPAY_RATE_LIMIT, capacity=RAZORPAY_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited = 0.0
+
+    def acquire(self):
+        """Take a token, sleeping until one is available. Returns the seconds waited."""
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    self.waited += waited
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+def backoff_delay(attempt, response=None):
+    """Seconds to wait before retry number attempt (0-based)."""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(float(retry_after), RAZORPAY_MAX_BACKOFF)
+            except ValueError:
+                pass
+    delay = min(RAZORPAY_BACKOFF * (2 ** attempt), RAZORPAY_MAX_BACKOFF)
+    return delay * random.uniform(0.5, 1.0)
+
+
+class RazorpaySession(requests.Session):
+    """Keep-alive session that rate limits and retries every request."""
+
+    def __init__(self, limiter, max_retries=RAZORPAY_MAX_RETRIES, pool_size=IO_WORKERS):
+        super().__init__()
+        self.limiter = limiter
+        self.max_retries = max_retries
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+
+    def _count(self, **counters):
+        with self._stats_lock:
+            for name, value in counters.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def request(self, method, url, *args, **kwargs):
+        kwargs.setdefault("timeout", RAZORPAY_TIMEOUT)
+        idempotent = method.upper() in ("GET", "HEAD", "OPTIONS")
+
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            self._count(requests=1)
+            try:
+                response = super().request(method, url, *args, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+                delay = backoff_delay(attempt)
+                print(f"Razorpay {method} {url} failed ({str(e)}), retrying in {delay:.2f}s")
+            else:
+                if response.status_code == 429:
+                    self._count(throttled=1)
+                retry = response.status_code == 429 or (idempotent and response.status_code in RETRY_STATUSES)
+                if not retry or attempt >= self.max_retries:
+                    return response
+                delay = backoff_delay(attempt, response)
+                response.close()
+            self._count(retries=1)
+            time.sleep(delay)
+            attempt += 1
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "throttled": self.throttled,
+                "rate_limit_wait_seconds": round(self.limiter.waited, 3)
+            }
+
+
+class RazorpayClientPool:
+    """One keep-alive session per account and one client per set of credentials."""
+
+    def __init__(self, base_url=RAZORPAY_BASE_URL, rate=RAZORPAY_RATE_LIMIT, burst=RAZORPAY_BURST):
+        self.base_url = base_url
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._clients = {}
+
+    def get_client(self, key_id, key_secret):
+        """Return the shared razorpay.Client for these credentials."""
+        with self._lock:
+            client = self._clients.get((key_id, key_secret))
+            if client is None:
+                session = self._sessions.get(key_id)
+                if session is None:
+                    session = self._sessions[key_id] = RazorpaySession(TokenBucket(self.rate, self.burst))
+                # Only override the SDK's base URL when one is configured: razorpay 1.x
+                # includes /v1 in its default, 2.x adds it to each resource path
+                options = {"base_url": self.base_url} if self.base_url else {}
+                client = razorpay.Client(session=session, auth=(key_id, key_secret), **options)
+                self._clients[(key_id, key_secret)] = client
+            return client
+
+    def discard(self, key_id, key_secret):
+        """Forget a client, e.g. after its credentials were rejected."""
+        with self._lock:
+            self._clients.pop((key_id, key_secret), None)
+
+    def stats(self):
+        with self._lock:
+            sessions = dict(self._sessions)
+            clients = len(self._clients)
+        return {
+            "clients": clients,
+            "accounts": {key_id: session.stats() for key_id, session in sessions.items()}
+        }
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            self._clients.clear()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the shared client pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = RazorpayClientPool()
+        return _pool
+
+
+def get_client(key_id, key_secret):
+    """Return the shared client for a set of credentials."""
+    return get_pool().get_client(key_id, key_secret)
+
+
+def close_pool():
+    """Close every pooled connection."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
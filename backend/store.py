@@ -0,0 +1,582 @@
+"""
+Transaction storage for the FinFlow API.
+
+Transactions are kept in an append-only CSV log. Inserts append a single row
+instead of re-reading and rewriting the whole file, fsyncs are batched by a
+background thread, and the file is periodically compacted (normalized and
+rewritten) off the request path. Reads never write: they are served from a
+cached, normalized frame, spending per month and category is kept up to date
+as rows are appended, and older files are repaired explicitly with
+
+    python -m backend.store validate|migrate [csv_path]
+"""
+
+import csv
+import io
+import math
+import os
+import threading
+import time
+import traceback
+from datetime import datetime
+
+import pandas as pd
+
+from ledger_cache import LedgerCache, file_stamp
+from backend.locking import file_lock
+from backend.aggregates import aggregate_transactions
+from backend.config import (
+    CSV_PATH, TRANSACTION_STORE,
+    STORE_FSYNC_INTERVAL, STORE_COMPACT_THRESHOLD, STORE_ID_BLOCK_SIZE,
+    STORE_GROUP_COMMIT, STORE_GROUP_COMMIT_WINDOW
+)
+
+# Columns every transaction row is expected to have
+EXPECTED_COLUMNS = [
+    "category", "amount", "description", "method",
+    "created_at", "id", "razorpay_payment_id",
+    "razorpay_order_id", "status"
+]
+
+
+def normalize_frame(df):
+    """Fill in missing columns/ids and clean problematic values."""
+    # Make sure id field is present for DataGrid
+    if 'id' not in df.columns or df['id'].isnull().any():
+        df['id'] = range(len(df))
+
+    # Handle any missing columns to avoid future issues
+    for col in EXPECTED_COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+
+    # Clean any problematic values
+    df = df.replace([float('inf'), -float('inf')], 0)
+    df = df.fillna(0)  # Replace NaN with 0 for numeric fields
+    return df
+
+
+def read_transactions_file(path):
+    """Parse a transaction file into a normalized frame without modifying it."""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return pd.DataFrame(columns=EXPECTED_COLUMNS)
+    try:
+        df = pd.read_csv(path, encoding="utf-8")
+    except pd.errors.EmptyDataError:
+        df = pd.DataFrame(columns=EXPECTED_COLUMNS)
+    return normalize_frame(df)
+
+
+def parse_rows(text, columns):
+    """Parse headerless CSV lines written in the given column order."""
+    df = pd.read_csv(io.StringIO(text), names=columns, header=None)
+    return normalize_frame(df)
+
+
+def _monthly_key(row):
+    """(year_month, category) of a row as it will read back, or None if undated."""
+    try:
+        year_month = datetime.strptime(str(row.get("created_at"))[:10], "%Y-%m-%d").strftime("%Y-%m")
+    except ValueError:
+        return None
+    # Blank categories read back as 0, like every other missing value
+    category = row.get("category")
+    return year_month, "0" if category is None or category == "" else str(category)
+
+
+def _amount(row):
+    try:
+        amount = float(row.get("amount"))
+    except (TypeError, ValueError):
+        return 0.0
+    return amount if math.isfinite(amount) else 0.0
+
+
+def add_monthly_rows(totals, rows):
+    """Add rows (dicts, as appended) to totals without going through pandas."""
+    for row in rows:
+        key = _monthly_key(row)
+        if key is not None:
+            bucket = totals.setdefault(key, [0.0, 0])
+            bucket[0] += _amount(row)
+            bucket[1] += 1
+
+
+def add_monthly_totals(totals, df):
+    """Add df's spending to totals, a {(year_month, category): [total, count]} dict."""
+    for row in aggregate_transactions(df, "month", "category"):
+        bucket = totals.setdefault((row["period"], row["category"]), [0.0, 0])
+        bucket[0] += row["total"]
+        bucket[1] += row["count"]
+
+
+def write_frame_atomic(df, path):
+    """Write df to a temporary file and swap it into place."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+        df.to_csv(f, index=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def validate_transactions_file(path):
+    """Return a list of problems that migrate_transactions_file would fix."""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return [f"{path} does not exist or is empty"]
+
+    df = pd.read_csv(path, encoding="utf-8")
+    problems = []
+    missing = [col for col in EXPECTED_COLUMNS if col not in df.columns]
+    if missing:
+        problems.append(f"missing columns: {', '.join(missing)}")
+    if "id" in df.columns:
+        if df["id"].isnull().any():
+            problems.append("rows without an id")
+        elif df["id"].duplicated().any():
+            problems.append("duplicate ids")
+    numeric = df.select_dtypes(include="number")
+    if numeric.isin([float("inf"), -float("inf")]).any().any():
+        problems.append("infinite values")
+    if df.isnull().any().any():
+        problems.append("empty values")
+    return problems
+
+
+def migrate_transactions_file(path):
+    """Rewrite a transaction file in normalized form (one-time repair)."""
+    # Hold the writers' lock so a running API can't append mid-rewrite
+    with file_lock(path):
+        df = read_transactions_file(path)
+        write_frame_atomic(df, path)
+    return len(df)
+
+
+class IdSequence:
+    """
+    Persistent transaction id sequence shared by every process.
+
+    The next free id lives in a small counter file, updated under a file
+    lock. With the default block_size of 1 every id is taken from the file,
+    so ids increase across processes in the order they are allocated. A
+    larger block_size reserves that many ids per update and hands them out
+    from memory, trading the locked write per insert for ids that are only
+    unique across processes and increasing within each one.
+    """
+
+    def __init__(self, path, initial_value, block_size=STORE_ID_BLOCK_SIZE):
+        """initial_value: callable giving the first id when the counter file doesn't exist yet."""
+        self.path = path
+        self.block_size = max(1, block_size)
+        self._initial_value = initial_value
+        self._lock = threading.Lock()
+        self._next = 0
+        self._limit = 0
+
+    def _reserve_block(self):
+        with file_lock(self.path):
+            value = None
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    content = f.read().strip()
+                if content:
+                    value = int(content)
+            if value is None:
+                value = self._initial_value()
+
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(str(value + self.block_size))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+
+        self._next = value
+        self._limit = value + self.block_size
+
+    def next_id(self):
+        """Return the next unused id."""
+        with self._lock:
+            if self._next >= self._limit:
+                self._reserve_block()
+            value = self._next
+            self._next += 1
+            return value
+
+
+class WriteCoordinator:
+    """
+    Serialize writes to one file across threads and processes.
+
+    Appends and rewrites hold an exclusive file lock, so concurrent writers
+    never interleave rows or lose them to a rewrite, and rewrites are
+    committed atomically by swapping in a temporary file. In group-commit
+    mode concurrent appends are batched: one caller writes everybody's rows
+    with a single fsync while the others wait, so every append is durable
+    when it returns. Otherwise appends are fsynced later by sync().
+    """
+
+    def __init__(self, path, group_commit=STORE_GROUP_COMMIT,
+                 commit_window=STORE_GROUP_COMMIT_WINDOW):
+        self.path = path
+        self.group_commit = group_commit
+        self.commit_window = commit_window
+
+        self._commit_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending = []
+        self._file = None
+        self._unsynced = False
+
+    def _ensure_open(self):
+        """Open the append handle, reopening it if another process replaced the file."""
+        if self._file is not None:
+            try:
+                current = os.stat(self.path)
+                opened = os.fstat(self._file.fileno())
+                if (current.st_dev, current.st_ino) == (opened.st_dev, opened.st_ino):
+                    return
+            except FileNotFoundError:
+                pass
+            self._file.close()
+            self._file = None
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path, "a", newline="", encoding="utf-8")
+
+    def _write(self, chunks, header, durable):
+        """
+        Append chunks under the file lock; the caller holds _commit_lock.
+
+        Returns the file's inode and the (start, end) byte offsets of each chunk.
+        """
+        with file_lock(self.path):
+            self._ensure_open()
+            stat = os.fstat(self._file.fileno())
+            offset = stat.st_size
+            if header and offset == 0:
+                print(f"Creating a fresh transaction file at {self.path}")
+                self._file.write(header)
+                offset += len(header.encode("utf-8"))
+            spans = []
+            for chunk in chunks:
+                end = offset + len(chunk.encode("utf-8"))
+                spans.append((offset, end))
+                offset = end
+            self._file.write("".join(chunks))
+            self._file.flush()
+            if durable:
+                os.fsync(self._file.fileno())
+            else:
+                self._unsynced = True
+            return stat.st_ino, spans
+
+    def append(self, text, header=None):
+        """
+        Append text (complete CSV lines); header is written first if the file is empty.
+
+        Returns (inode, start, end): the file and byte range the text landed in.
+        """
+        if not self.group_commit:
+            with self._commit_lock:
+                inode, spans = self._write([text], header, durable=False)
+            return (inode,) + spans[0]
+
+        entry = {"text": text, "done": threading.Event(), "error": None, "span": None}
+        with self._pending_lock:
+            self._pending.append(entry)
+
+        with self._commit_lock:
+            # Whoever gets the lock first commits everything queued so far
+            if not entry["done"].is_set():
+                if self.commit_window:
+                    time.sleep(self.commit_window)  # let concurrent inserts join the batch
+                with self._pending_lock:
+                    batch, self._pending = self._pending, []
+                try:
+                    inode, spans = self._write([item["text"] for item in batch], header, durable=True)
+                    for item, span in zip(batch, spans):
+                        item["span"] = (inode,) + span
+                except Exception as e:
+                    for item in batch:
+                        item["error"] = e
+                finally:
+                    for item in batch:
+                        item["done"].set()
+
+        if entry["error"] is not None:
+            raise entry["error"]
+        return entry["span"]
+
+    def rewrite(self, build):
+        """
+        Replace the file with the frame returned by build(), atomically.
+
+        Returns the frame and the new file's os.stat().
+        """
+        with self._commit_lock:
+            with file_lock(self.path):
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                    self._unsynced = False
+                df = build()
+                write_frame_atomic(df, self.path)
+                return df, os.stat(self.path)
+
+    def sync(self):
+        """fsync appended rows that are not yet on disk."""
+        with self._commit_lock:
+            if self._unsynced and self._file is not None:
+                os.fsync(self._file.fileno())
+                self._unsynced = False
+
+    def close(self):
+        self.sync()
+        with self._commit_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class CsvTransactionStore:
+    """Append-only CSV transaction log with batched fsync and compaction."""
+
+    def __init__(self, path, fsync_interval=STORE_FSYNC_INTERVAL,
+                 compact_threshold=STORE_COMPACT_THRESHOLD):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.compact_threshold = compact_threshold
+
+        self._lock = threading.RLock()
+        self._columns = list(EXPECTED_COLUMNS)
+        self._ids = IdSequence(path + ".seq", self._compute_next_id)
+        self._writer = WriteCoordinator(path)
+        self._appended_since_compact = 0
+
+        # Parsed, normalized ledger shared by every read endpoint
+        self.cache = LedgerCache(lambda: read_transactions_file(self.path), file_stamp(self.path))
+
+        # Spending per month and category, kept up to date as rows are appended.
+        # _monthly_file is the (inode, byte offset) of the file the totals cover.
+        self._monthly = None
+        self._monthly_file = None
+        self._monthly_columns = None
+
+        self._open()
+
+        self._stop = threading.Event()
+        self._worker = threading.Thread(target=self._run_background, daemon=True)
+        self._worker.start()
+
+    def _open(self):
+        """Inspect the log file without modifying it."""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            self._columns = list(EXPECTED_COLUMNS)
+            return
+
+        with open(self.path, "r", newline="", encoding="utf-8") as f:
+            header = next(csv.reader(f), [])
+        self._columns = header
+
+        missing = [col for col in EXPECTED_COLUMNS if col not in header]
+        if missing:
+            print(f"Transaction file {self.path} is missing columns {missing}; "
+                  f"run 'python -m backend.store migrate' before adding transactions")
+
+    def _compute_next_id(self):
+        """Scan the id column once to seed a new id sequence."""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return 0
+        try:
+            df = pd.read_csv(self.path, usecols=["id"], encoding="utf-8")
+        except Exception as e:
+            print(f"Error reading transaction ids: {str(e)}")
+            return 0
+        ids = pd.to_numeric(df["id"], errors="coerce").dropna()
+        return int(ids.max()) + 1 if len(ids) > 0 else 0
+
+    def _writable_columns(self):
+        """Return the column order rows must be written in."""
+        with self._lock:
+            if any(col not in self._columns for col in EXPECTED_COLUMNS):
+                # The file may have been created or migrated since we last looked
+                self._open()
+            if any(col not in self._columns for col in EXPECTED_COLUMNS):
+                raise RuntimeError(
+                    f"Transaction file {self.path} needs migration; run 'python -m backend.store migrate'")
+            return list(self._columns)
+
+    def append(self, record):
+        """Store a single transaction and return it with its id."""
+        return self.append_many([record])[0]
+
+    def append_many(self, records):
+        """Store several transactions and return them with their ids."""
+        columns = self._writable_columns()
+
+        stored = []
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+        for record in records:
+            row = dict(record)
+            if row.get("id") is None:
+                row["id"] = self._ids.next_id()
+            writer.writerow(row)
+            stored.append(row)
+
+        header = io.StringIO()
+        csv.writer(header).writerow(columns)
+
+        # Not under self._lock, so concurrent appends can share a group commit
+        text = buffer.getvalue()
+        inode, start, end = self._writer.append(text, header=header.getvalue())
+
+        with self._lock:
+            self._appended_since_compact += len(stored)
+            self.cache.invalidate()
+            # Rows that directly follow what the totals cover are added here;
+            # anything else (e.g. another process got there first) is read
+            # from the file by monthly_totals()
+            if self._monthly is not None and self._monthly_file == (inode, start):
+                add_monthly_rows(self._monthly, stored)
+                self._monthly_file = (inode, end)
+        return stored
+
+    def read_frame(self):
+        """
+        Return the cached normalized frame, re-reading only when the file changed.
+
+        The frame is shared between callers and must be treated as read-only.
+        """
+        return self.cache.get()
+
+    def monthly_totals(self):
+        """
+        Return (stamp, rows): spending per month and category.
+
+        rows are {"year_month", "category", "total", "count"} dicts; stamp
+        changes whenever they do. The file is read in full only the first time
+        and after another process rewrites it. Appends by this process are
+        added by append_many, and rows appended by other processes are read
+        from the end of the file.
+        """
+        with self._lock:
+            with file_lock(self.path):
+                try:
+                    stat = os.stat(self.path)
+                    inode, size = stat.st_ino, stat.st_size
+                except FileNotFoundError:
+                    inode, size = None, 0
+
+                covered = self._monthly_file
+                if self._monthly is None or covered[0] != inode or covered[1] > size:
+                    self._monthly = {}
+                    self._monthly_columns = None
+                    if size:
+                        with open(self.path, "r", newline="", encoding="utf-8") as f:
+                            self._monthly_columns = next(csv.reader(f), [])
+                    add_monthly_totals(self._monthly, read_transactions_file(self.path))
+                elif covered[1] < size:
+                    with open(self.path, "rb") as f:
+                        f.seek(covered[1])
+                        tail = f.read(size - covered[1]).decode("utf-8")
+                    add_monthly_totals(self._monthly, parse_rows(tail, self._monthly_columns))
+                self._monthly_file = (inode, size)
+
+            rows = [
+                {"year_month": year_month, "category": category, "total": total, "count": count}
+                for (year_month, category), (total, count) in sorted(self._monthly.items())
+            ]
+            return self._monthly_file, rows
+
+    def records(self):
+        """Return all transactions as JSON-safe records."""
+        return self.view("records", lambda df: df.to_dict(orient="records"))
+
+    def view(self, key, build):
+        """Return build(frame) memoized under key until the file changes."""
+        return self.cache.view(key, build)
+
+    def sync(self):
+        """fsync any appended rows that are not yet on disk."""
+        self._writer.sync()
+
+    def compact(self):
+        """Rewrite the log in normalized form."""
+        df, stat = self._writer.rewrite(lambda: read_transactions_file(self.path))
+        with self._lock:
+            self._columns = list(df.columns)
+            self._appended_since_compact = 0
+            self.cache.invalidate()
+            # The rewritten frame is already in memory, so recount from it
+            # rather than re-reading the new file
+            if self._monthly is not None:
+                self._monthly = {}
+                add_monthly_totals(self._monthly, df)
+                self._monthly_columns = list(df.columns)
+                self._monthly_file = (stat.st_ino, stat.st_size)
+
+    def _run_background(self):
+        """Periodically fsync appended rows and compact the log when it grows."""
+        while not self._stop.wait(self.fsync_interval):
+            try:
+                self.sync()
+                if self._appended_since_compact >= self.compact_threshold:
+                    self.compact()
+            except Exception as e:
+                print(f"Error in transaction store background task: {str(e)}")
+                traceback.print_exc()
+
+    def close(self):
+        """Flush pending writes and stop the background thread."""
+        self._stop.set()
+        self._worker.join(timeout=5)
+        self._writer.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Return the process-wide transaction store, creating it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            if TRANSACTION_STORE == "csv":
+                _store = CsvTransactionStore(CSV_PATH)
+            else:
+                raise ValueError(f"Unknown transaction store: {TRANSACTION_STORE}")
+        return _store
+
+
+def close_store():
+    """Flush and close the process-wide transaction store."""
+    global _store
+    with _store_lock:
+        if _store is not None:
+            _store.close()
+            _store = None
+
+
+if __name__ == "__main__":
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    path = sys.argv[2] if len(sys.argv) > 2 else CSV_PATH
+
+    if command == "validate":
+        problems = validate_transactions_file(path)
+        for problem in problems:
+            print(f"{path}: {problem}")
+        if not problems:
+            print(f"{path} is valid")
+        sys.exit(1 if problems else 0)
+    elif command == "migrate":
+        count = migrate_transactions_file(path)
+        print(f"Migrated {count} transactions in {path}")
+    else:
+        print("Usage: python -m backend.store validate|migrate [csv_path]")
+        sys.exit(2)
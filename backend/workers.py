@@ -0,0 +1,43 @@
+"""
+Bounded thread pool for blocking work done by the async API handlers.
+
+Pandas file I/O and the Razorpay SDK are synchronous. Running them directly
+inside an async handler blocks the event loop, so every other request waits.
+Handlers hand that work to run_blocking() instead; the pool size caps how many
+blocking calls run at once (FINFLOW_IO_WORKERS).
+"""
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.config import IO_WORKERS
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the shared executor, creating it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="finflow-io")
+            print(f"Started blocking I/O pool with {IO_WORKERS} workers")
+        return _executor
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run func(*args, **kwargs) in the pool and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+
+
+def shutdown_executor():
+    """Wait for queued work to finish and stop the pool."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
@@ -1,131 +1,399 @@
 import os
+import csv
 import json
 import sqlite3
-import hashlib
 import secrets
+import queue
+import threading
+import time
 from datetime import datetime, timedelta
+from session_cache import SessionCache
+from password_hasher import PasswordHasher
 
 # User database path
 DB_PATH = "finflow.db"
 
+# Prepared statements kept per connection (sqlite3's default is 128)
+STATEMENT_CACHE_SIZE = 256
+# How long a writer waits for another connection's write lock, in milliseconds
+BUSY_TIMEOUT_MS = 5000
+
+# Session lookups are cached for this many seconds (bounds staleness when
+# another process logs a user out) and at most this many tokens are kept
+SESSION_CACHE_TTL = int(os.getenv("FINFLOW_SESSION_CACHE_TTL", "60"))
+SESSION_CACHE_SIZE = int(os.getenv("FINFLOW_SESSION_CACHE_SIZE", "10000"))
+
+session_cache = SessionCache(SESSION_CACHE_TTL, SESSION_CACHE_SIZE)
+
+# Oldest sessions beyond this many per user are dropped when a new one starts
+MAX_SESSIONS_PER_USER = int(os.getenv("FINFLOW_MAX_SESSIONS_PER_USER", "10"))
+# Seconds between background sweeps of expired sessions, and rows per delete
+SESSION_SWEEP_INTERVAL = int(os.getenv("FINFLOW_SESSION_SWEEP_INTERVAL", "3600"))
+SESSION_SWEEP_BATCH = 1000
+
+# PBKDF2 runs in a process pool so logins don't pin request threads. Stored
+# hashes carry their own iteration count and are upgraded on the next login
+# when PASSWORD_ITERATIONS changes.
+PASSWORD_ITERATIONS = int(os.getenv("FINFLOW_PASSWORD_ITERATIONS", "100000"))
+PASSWORD_HASH_WORKERS = int(os.getenv("FINFLOW_PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_CONCURRENCY = int(os.getenv("FINFLOW_PASSWORD_HASH_MAX_CONCURRENCY", "16"))
+
+password_hasher = PasswordHasher(PASSWORD_ITERATIONS, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_CONCURRENCY)
+
+# Callbacks run after transactions are written (e.g. to invalidate caches)
+_transaction_listeners = []
+
+# Connections are kept in a bounded pool and reused across requests, so that
+# prepared statements stay cached and the PRAGMAs run once per connection.
+# A thread checks one out on first use and keeps it until release_connection()
+# (called when each web request ends, or when the thread exits).
+DB_POOL_SIZE = int(os.getenv("FINFLOW_DB_POOL_SIZE", "8"))
+# Seconds a thread waits for a free connection before giving up
+DB_POOL_TIMEOUT = 30
+
+_local = threading.local()
+_pools = {}
+_pools_lock = threading.Lock()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+def _connect(path=None):
+    conn = sqlite3.connect(path or DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000,
+                           cached_statements=STATEMENT_CACHE_SIZE,
+                           check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    # WAL lets readers keep going while a write is in progress
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    return conn
+
+class ConnectionPool:
+    """At most size SQLite connections to one database, reused between threads"""
+    
+    def __init__(self, path, size=DB_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.checkouts = 0
+        self.waits = 0
+    
+    def acquire(self, timeout=DB_POOL_TIMEOUT):
+        """Check out an idle connection, opening one while under size"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self.opened < self.size
+                if can_open:
+                    self.opened += 1
+                else:
+                    self.waits += 1
+            if can_open:
+                try:
+                    conn = _connect(self.path)
+                except Exception:
+                    with self._lock:
+                        self.opened -= 1
+                    raise
+            else:
+                try:
+                    conn = self._idle.get(timeout=timeout)
+                except queue.Empty:
+                    raise sqlite3.OperationalError(f"No database connection free after {timeout}s")
+        with self._lock:
+            self.checkouts += 1
+        return conn
+    
+    def release(self, conn):
+        """Return a connection, rolling back anything left uncommitted"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # A broken connection is replaced instead of reused
+            with self._lock:
+                self.opened -= 1
+            conn.close()
+            return
+        self._idle.put(conn)
+    
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "opened": self.opened,
+                "idle": self._idle.qsize(),
+                "checkouts": self.checkouts,
+                "waits": self.waits
+            }
+
+class _Lease:
+    """A thread's checked out connection; returned to its pool if the thread exits holding it"""
+    
+    def __init__(self, pool, conn):
+        self.pool = pool
+        self.conn = conn
+    
+    def release(self):
+        if self.conn is not None:
+            conn, self.conn = self.conn, None
+            self.pool.release(conn)
+    
+    def __del__(self):
+        self.release()
+
+def get_pool():
+    """Get the connection pool of DB_PATH in this process"""
+    key = (os.getpid(), DB_PATH)
+    with _pools_lock:
+        # Connections are not shared with forked children or across databases
+        if key not in _pools:
+            _pools[key] = ConnectionPool(DB_PATH)
+        return _pools[key]
+
+def get_connection():
+    """Get this thread's connection, checking one out of the pool on first use"""
+    pool = get_pool()
+    lease = getattr(_local, "lease", None)
+    if lease is not None and lease.conn is not None and lease.pool is pool:
+        return lease.conn
+    release_connection()
+    if DB_PATH not in _schema_ready:
+        init_db()
+    _local.lease = _Lease(pool, pool.acquire())
+    return _local.lease.conn
+
+def release_connection():
+    """Return this thread's connection to the pool (a new one is checked out on next use)"""
+    lease = getattr(_local, "lease", None)
+    if lease is not None:
+        _local.lease = None
+        lease.release()
+
 def init_db():
     """Initialize database and tables if they don't exist"""
-    if not os.path.exists(DB_PATH):
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Create users table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            full_name TEXT,
-            monthly_income REAL DEFAULT 0,
-            monthly_limit REAL DEFAULT 0,
-            created_at TEXT,
-            last_login TEXT
-        )
-        ''')
-        
-        # Create sessions table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS sessions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            token TEXT UNIQUE NOT NULL,
-            created_at TEXT,
-            expires_at TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-        ''')
-        
-        # Create recurring expenses table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS recurring_expenses (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            category TEXT NOT NULL,
-            amount REAL NOT NULL,
-            day_of_month INTEGER NOT NULL,
-            next_due TEXT,
-            created_at TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-        ''')
-        
-        conn.commit()
-        conn.close()
-        
+    # Every statement is idempotent, so databases created by older versions
+    # pick up new tables and indexes as well
+    with _schema_lock:
+        _create_schema()
+        _schema_ready.add(DB_PATH)
+
+def _create_schema():
+    conn = _connect()
+    cursor = conn.cursor()
+    
+    # Create users table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        full_name TEXT,
+        monthly_income REAL DEFAULT 0,
+        monthly_limit REAL DEFAULT 0,
+        created_at TEXT,
+        last_login TEXT
+    )
+    ''')
+    
+    # Create sessions table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        token TEXT UNIQUE NOT NULL,
+        created_at TEXT,
+        expires_at TEXT,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+    ''')
+    
+    # Token lookups filter on expiry, the sweeper deletes by it and the
+    # per-user cap walks a user's sessions newest first
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (expires_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user_created ON sessions (user_id, created_at)")
+    
+    # Create recurring expenses table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS recurring_expenses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        category TEXT NOT NULL,
+        amount REAL NOT NULL,
+        day_of_month INTEGER NOT NULL,
+        next_due TEXT,
+        created_at TEXT,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+    ''')
+    
+    # The recurring run looks up everything due by next_due
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_recurring_next_due ON recurring_expenses (next_due)")
+    
+    # Run ledger for recurring expenses: one row per run, and one per posted
+    # occurrence so no occurrence can ever be posted twice
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS recurring_runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        as_of TEXT NOT NULL,
+        started_at TEXT NOT NULL,
+        finished_at TEXT,
+        posted INTEGER DEFAULT 0
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS recurring_postings (
+        expense_id INTEGER NOT NULL,
+        due_date TEXT NOT NULL,
+        run_id INTEGER,
+        posted_at TEXT,
+        PRIMARY KEY (expense_id, due_date)
+    )
+    ''')
+    
+    # One-off data migrations that have been applied to this database
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        name TEXT PRIMARY KEY,
+        applied_at TEXT NOT NULL
+    )
+    ''')
+    
+    # Create transactions table (replaces classified_transactions.csv)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS transactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        category TEXT NOT NULL,
+        amount REAL NOT NULL,
+        created_at TEXT NOT NULL,
+        payment_id TEXT,
+        payment_status TEXT,
+        description TEXT,
+        source TEXT,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+    ''')
+    
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_user_created ON transactions (user_id, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_created_at ON transactions (created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_category ON transactions (category)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_payment_id ON transactions (payment_id)")
+    
+    # Create rollups table: spending per user x month x ISO week x category,
+    # kept up to date on every insert so summaries never scan transactions.
+    # user_id 0 holds transactions that don't belong to a user.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS transaction_rollups (
+        user_id INTEGER NOT NULL DEFAULT 0,
+        year_month TEXT NOT NULL,
+        iso_week TEXT NOT NULL,
+        category TEXT NOT NULL,
+        total REAL NOT NULL DEFAULT 0,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, year_month, iso_week, category)
+    )
+    ''')
+    
+    # High-water mark of each Razorpay account's incremental sync
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS razorpay_sync_checkpoints (
+        account_id TEXT PRIMARY KEY,
+        last_created_at INTEGER NOT NULL,
+        last_payment_id TEXT,
+        synced_at TEXT NOT NULL,
+        imported INTEGER DEFAULT 0
+    )
+    ''')
+    
+    conn.commit()
+    conn.close()
+    
 def hash_password(password):
     """Hash a password for storing."""
-    salt = hashlib.sha256(os.urandom(60)).hexdigest()
-    pwdhash = hashlib.pbkdf2_hmac('sha512', password.encode('utf-8'), 
-                                salt.encode('ascii'), 100000)
-    pwdhash = pwdhash.hex()
-    return salt + pwdhash
+    return password_hasher.hash(password)
     
 def verify_password(stored_password, provided_password):
     """Verify a stored password against one provided by user"""
-    salt = stored_password[:64]
-    stored_password = stored_password[64:]
-    pwdhash = hashlib.pbkdf2_hmac('sha512', 
-                                provided_password.encode('utf-8'), 
-                                salt.encode('ascii'), 
-                                100000)
-    pwdhash = pwdhash.hex()
-    return pwdhash == stored_password
+    return password_hasher.verify(stored_password, provided_password)
+
+def _insert_session(cursor, user_id, now):
+    """Insert a 30-day session for a user and return its token"""
+    token = secrets.token_hex(32)
+    expires_at = (now + timedelta(days=30)).isoformat()
+    cursor.execute('''
+    INSERT INTO sessions (user_id, token, created_at, expires_at)
+    VALUES (?, ?, ?, ?)
+    ''', (user_id, token, now.isoformat(), expires_at))
+    
+    # Keep only the newest MAX_SESSIONS_PER_USER sessions
+    cursor.execute('''
+    SELECT id, token FROM sessions WHERE user_id = ?
+    ORDER BY created_at DESC, id DESC
+    LIMIT -1 OFFSET ?
+    ''', (user_id, MAX_SESSIONS_PER_USER))
+    evicted = cursor.fetchall()
+    if evicted:
+        cursor.executemany("DELETE FROM sessions WHERE id = ?", [(row["id"],) for row in evicted])
+        for row in evicted:
+            session_cache.invalidate_token(row["token"])
+    return token
+
+def create_session(user_id):
+    """Start a session for a user whose identity is already established (e.g. at signup)"""
+    conn = get_connection()
+    with conn:
+        return _insert_session(conn.cursor(), user_id, datetime.now())
 
 def create_user(email, password, full_name, monthly_income):
     """Create a new user in the database"""
-    init_db()
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     
     try:
         hashed_pwd = hash_password(password)
         now = datetime.now().isoformat()
         
-        cursor.execute('''
-        INSERT INTO users (email, password_hash, full_name, monthly_income, created_at)
-        VALUES (?, ?, ?, ?, ?)
-        ''', (email, hashed_pwd, full_name, monthly_income, now))
+        with conn:
+            cursor.execute('''
+            INSERT INTO users (email, password_hash, full_name, monthly_income, created_at)
+            VALUES (?, ?, ?, ?, ?)
+            ''', (email, hashed_pwd, full_name, monthly_income, now))
         
-        user_id = cursor.lastrowid
-        conn.commit()
-        return user_id
+        return cursor.lastrowid
     except sqlite3.IntegrityError:
         # Email already exists
         return None
-    finally:
-        conn.close()
 
 def login_user(email, password):
     """Verify user credentials and create a session"""
-    init_db()
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = get_connection()
     cursor = conn.cursor()
     
     cursor.execute("SELECT * FROM users WHERE email = ?", (email,))
     user = cursor.fetchone()
     
     if user and verify_password(user['password_hash'], password):
-        # Update last login
-        now = datetime.now().isoformat()
-        cursor.execute("UPDATE users SET last_login = ? WHERE id = ?", (now, user['id']))
-        
-        # Create a new session
-        token = secrets.token_hex(32)
-        expires_at = (datetime.now() + timedelta(days=30)).isoformat()
+        now = datetime.now()
         
-        cursor.execute('''
-        INSERT INTO sessions (user_id, token, created_at, expires_at)
-        VALUES (?, ?, ?, ?)
-        ''', (user['id'], token, now, expires_at))
+        # Upgrade hashes made with an older format or iteration count while
+        # the plain password is at hand
+        new_hash = None
+        if password_hasher.needs_rehash(user['password_hash']):
+            new_hash = hash_password(password)
         
-        conn.commit()
+        with conn:
+            # Update last login
+            cursor.execute("UPDATE users SET last_login = ? WHERE id = ?", (now.isoformat(), user['id']))
+            if new_hash:
+                cursor.execute("UPDATE users SET password_hash = ? WHERE id = ?", (new_hash, user['id']))
+            
+            # Create a new session
+            token = _insert_session(cursor, user['id'], now)
         
         # Return user data and session token
         return {
@@ -137,63 +405,100 @@ def login_user(email, password):
             'token': token
         }
     
-    conn.close()
     return None
 
 def get_user_by_token(token):
     """Get user data from a session token"""
     if not token:
         return None
+    
+    cached = session_cache.get(token)
+    if cached is not None:
+        return cached
         
-    init_db()
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = get_connection()
     cursor = conn.cursor()
     
-    now = datetime.now().isoformat()
+    now = datetime.now()
     
     cursor.execute('''
-    SELECT u.* FROM users u
+    SELECT u.*, s.expires_at AS session_expires_at FROM users u
     JOIN sessions s ON u.id = s.user_id
     WHERE s.token = ? AND s.expires_at > ?
-    ''', (token, now))
+    ''', (token, now.isoformat()))
     
-    user = cursor.fetchone()
-    
-    if user:
-        return dict(user)
+    row = cursor.fetchone()
+    if not row:
+        return None
     
-    conn.close()
-    return None
+    user = dict(row)
+    expires_at = user.pop("session_expires_at")
+    # Never keep a session cached past its own expiry
+    session_cache.put(token, user, (datetime.fromisoformat(expires_at) - now).total_seconds())
+    return user
 
 def update_user_limit(user_id, monthly_limit):
     """Update a user's monthly spending limit"""
-    init_db()
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     
-    cursor.execute("UPDATE users SET monthly_limit = ? WHERE id = ?", (monthly_limit, user_id))
-    conn.commit()
-    conn.close()
+    with conn:
+        cursor.execute("UPDATE users SET monthly_limit = ? WHERE id = ?", (monthly_limit, user_id))
+    session_cache.invalidate_user(user_id)
     
     return True
 
 def logout_user(token):
     """Remove a user's session"""
-    init_db()
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     
-    cursor.execute("DELETE FROM sessions WHERE token = ?", (token,))
-    conn.commit()
-    conn.close()
+    with conn:
+        cursor.execute("DELETE FROM sessions WHERE token = ?", (token,))
+    session_cache.invalidate_token(token)
     
     return True
 
+def sweep_expired_sessions(batch_size=SESSION_SWEEP_BATCH):
+    """Delete expired sessions in small batches and return how many were removed"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    now = datetime.now().isoformat()
+    
+    removed = 0
+    while True:
+        # Short transactions so logins are never blocked behind one big delete
+        with conn:
+            cursor.execute('''
+            DELETE FROM sessions WHERE id IN (
+                SELECT id FROM sessions WHERE expires_at <= ? LIMIT ?
+            )
+            ''', (now, batch_size))
+        removed += cursor.rowcount
+        if cursor.rowcount < batch_size:
+            return removed
+
+def start_session_sweeper(interval=SESSION_SWEEP_INTERVAL):
+    """Sweep expired sessions every interval seconds in a daemon thread"""
+    def run():
+        while True:
+            try:
+                removed = sweep_expired_sessions()
+                if removed:
+                    print(f"Removed {removed} expired sessions")
+            except Exception as e:
+                print(f"Error sweeping sessions: {e}")
+            finally:
+                release_connection()
+            time.sleep(interval)
+    
+    thread = threading.Thread(target=run, name="session-sweeper", daemon=True)
+    thread.start()
+    return thread
+
 def add_recurring_expense(user_id, name, category, amount, day_of_month):
     """Add a recurring expense for a user"""
-    init_db()
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     
     # Calculate next due date
@@ -213,22 +518,17 @@ def add_recurring_expense(user_id, name, category, amount, day_of_month):
     now = datetime.now().isoformat()
     next_due_iso = next_due.isoformat().split('T')[0]
     
-    cursor.execute('''
-    INSERT INTO recurring_expenses (user_id, name, category, amount, day_of_month, next_due, created_at)
-    VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (user_id, name, category, amount, day_of_month, next_due_iso, now))
-    
-    expense_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    with conn:
+        cursor.execute('''
+        INSERT INTO recurring_expenses (user_id, name, category, amount, day_of_month, next_due, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, name, category, amount, day_of_month, next_due_iso, now))
     
-    return expense_id
+    return cursor.lastrowid
 
 def get_recurring_expenses(user_id):
     """Get all recurring expenses for a user"""
-    init_db()
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = get_connection()
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -241,22 +541,599 @@ def get_recurring_expenses(user_id):
     for row in cursor.fetchall():
         expenses.append(dict(row))
     
-    conn.close()
     return expenses
 
+def _following_month(date_obj, day_of_month):
+    """Get the same (capped) day of the month after date_obj"""
+    day = min(int(day_of_month), 28)
+    if date_obj.month == 12:
+        return date_obj.replace(year=date_obj.year + 1, month=1, day=day)
+    return date_obj.replace(month=date_obj.month + 1, day=day)
+
+def _shard_filter(shard, column="user_id"):
+    """SQL condition and params selecting one (index, count) shard of users"""
+    if shard is None:
+        return "", []
+    index, count = shard
+    return f" AND ({column} % ?) = ?", [count, index]
+
+def _reconcile_recurring_postings(cursor, now):
+    """
+    Record occurrences posted before the run ledger existed
+    
+    The old job posted an expense on its day of the month without moving
+    next_due, so next_due can be months behind what was already posted. Every
+    existing "Recurring: <name>" transaction of an expense is recorded in
+    recurring_postings under that month's due date, and next_due is moved past
+    the last month already posted. Months before it are not backfilled.
+    Idempotent, so it is safe to repeat (e.g. after importing old transactions).
+    """
+    cursor.execute("SELECT id, user_id, name, category, day_of_month FROM recurring_expenses")
+    expenses = {}
+    for row in cursor.fetchall():
+        key = (row["user_id"], f"Recurring: {row['name']}", row["category"])
+        expenses.setdefault(key, []).append((row["id"], min(int(row["day_of_month"]), 28)))
+    
+    # One pass over the recurring transactions, one row per expense and month
+    cursor.execute('''
+    SELECT DISTINCT user_id, description, category, substr(created_at, 1, 7) AS year_month
+    FROM transactions
+    WHERE source = 'recurring' AND created_at GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-*'
+    ''')
+    postings = []
+    for row in cursor.fetchall():
+        for expense_id, day in expenses.get((row["user_id"], row["description"], row["category"]), []):
+            postings.append((expense_id, f"{row['year_month']}-{day:02d}", now))
+    cursor.executemany('''
+    INSERT OR IGNORE INTO recurring_postings (expense_id, due_date, run_id, posted_at)
+    VALUES (?, ?, NULL, ?)
+    ''', postings)
+    
+    cursor.execute('''
+    SELECT e.id, e.day_of_month, e.next_due, MAX(p.due_date) AS last_posted
+    FROM recurring_expenses e JOIN recurring_postings p ON p.expense_id = e.id
+    GROUP BY e.id
+    ''')
+    updates = []
+    for row in cursor.fetchall():
+        following = _following_month(datetime.strptime(row["last_posted"], "%Y-%m-%d").date(),
+                                     row["day_of_month"]).isoformat()
+        if row["next_due"] is None or row["next_due"] < following:
+            updates.append((following, row["id"]))
+    cursor.executemany("UPDATE recurring_expenses SET next_due = ? WHERE id = ?", updates)
+
+def process_due_recurring_expenses(today=None, shard=None):
+    """
+    Post every occurrence of every recurring expense due on or before today.
+    
+    Due expenses are found with one indexed query on next_due. Occurrences
+    missed since then (e.g. the job didn't run for a few days) are backfilled,
+    each dated on its own due day. The transactions, a recurring_postings row
+    per occurrence (which refuses duplicates) and the move of next_due past
+    today are written in one database transaction, so reruns and concurrent
+    runs never post an occurrence twice.
+    
+    shard=(index, count) limits the run to users with user_id % count == index
+    so several processes or hosts can split the work. Returns the posted
+    transactions.
+    """
+    today = today or datetime.now().date()
+    conn = get_connection()
+    cursor = conn.cursor()
+    now = datetime.now().isoformat()
+    shard_sql, shard_params = _shard_filter(shard)
+    
+    with conn:
+        cursor.execute("INSERT INTO recurring_runs (as_of, started_at) VALUES (?, ?)", (today.isoformat(), now))
+        run_id = cursor.lastrowid
+        
+        # The first run on a database written by the old job records what it
+        # already posted, so those occurrences aren't backfilled again
+        cursor.execute("INSERT OR IGNORE INTO schema_migrations (name, applied_at) VALUES (?, ?)",
+                       ("reconcile_recurring_postings", now))
+        if cursor.rowcount:
+            _reconcile_recurring_postings(cursor, now)
+        
+        # Expenses saved before next_due was tracked fall due on this month's day
+        cursor.execute("SELECT id, day_of_month FROM recurring_expenses WHERE next_due IS NULL" + shard_sql, shard_params)
+        cursor.executemany("UPDATE recurring_expenses SET next_due = ? WHERE id = ? AND next_due IS NULL", [
+            (today.replace(day=min(int(row["day_of_month"]), 28)).isoformat(), row["id"])
+            for row in cursor.fetchall()
+        ])
+    
+    # Plan the run from a snapshot without holding the write lock, so shards
+    # in other processes can do the same at once
+    cursor.execute('''
+    SELECT p.expense_id, p.due_date FROM recurring_postings p
+    JOIN recurring_expenses e ON e.id = p.expense_id
+    WHERE e.next_due <= ? AND p.due_date >= e.next_due
+    ''' + _shard_filter(shard, "e.user_id")[0], [today.isoformat()] + shard_params)
+    already_posted = {(row["expense_id"], row["due_date"]) for row in cursor.fetchall()}
+    
+    cursor.execute('''
+    SELECT id, user_id, name, category, amount, day_of_month, next_due
+    FROM recurring_expenses
+    WHERE next_due <= ?
+    ''' + shard_sql, [today.isoformat()] + shard_params)
+    
+    planned = []
+    for expense in cursor.fetchall():
+        occurrences = []
+        due = datetime.strptime(expense["next_due"], "%Y-%m-%d").date()
+        while due <= today:
+            if (expense["id"], due.isoformat()) not in already_posted:
+                occurrences.append({
+                    "category": expense["category"],
+                    "amount": float(expense["amount"]),
+                    "created_at": due.isoformat(),
+                    "payment_id": None,
+                    "payment_status": "recurring",
+                    "description": f"Recurring: {expense['name']}",
+                    "source": "recurring",
+                    "user_id": expense["user_id"]
+                })
+            due = _following_month(due, expense["day_of_month"])
+        planned.append((expense["id"], expense["next_due"], due.isoformat(), occurrences))
+    
+    posted = []
+    postings = []
+    buckets = {}
+    with conn:
+        cursor.execute("BEGIN IMMEDIATE")
+        for expense_id, old_next_due, new_next_due, occurrences in planned:
+            # Skip expenses another run advanced after our snapshot
+            cursor.execute("UPDATE recurring_expenses SET next_due = ? WHERE id = ? AND next_due = ?",
+                           (new_next_due, expense_id, old_next_due))
+            if cursor.rowcount == 0:
+                continue
+            posted.extend(occurrences)
+            postings.extend((expense_id, txn["created_at"], run_id, now) for txn in occurrences)
+        
+        cursor.executemany('''
+        INSERT INTO recurring_postings (expense_id, due_date, run_id, posted_at)
+        VALUES (?, ?, ?, ?)
+        ''', postings)
+        cursor.executemany('''
+        INSERT INTO transactions (user_id, category, amount, created_at, payment_id, payment_status, description, source)
+        VALUES (:user_id, :category, :amount, :created_at, :payment_id, :payment_status, :description, :source)
+        ''', posted)
+        for transaction in posted:
+            _add_to_buckets(buckets, transaction)
+        _update_rollups(cursor, buckets)
+        
+        cursor.execute("UPDATE recurring_runs SET finished_at = ?, posted = ? WHERE id = ?",
+                       (datetime.now().isoformat(), len(posted), run_id))
+    
+    if posted:
+        _notify_transactions_changed()
+    return posted
+
 def delete_recurring_expense(expense_id, user_id):
     """Delete a recurring expense"""
-    init_db()
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     
+    with conn:
+        cursor.execute('''
+        DELETE FROM recurring_expenses
+        WHERE id = ? AND user_id = ?
+        ''', (expense_id, user_id))
+    
+    return cursor.rowcount > 0
+
+def _transaction_from_row(row):
+    """Shape a transactions row like the records the apps have always used"""
+    transaction = {
+        "id": row["id"],
+        "category": row["category"],
+        "amount": row["amount"],
+        "created_at": row["created_at"]
+    }
+    # Add optional fields if they are set
+    for field in ["payment_id", "payment_status", "description", "source", "user_id"]:
+        if row[field] is not None and row[field] != "":
+            transaction[field] = row[field]
+    return transaction
+
+def on_transactions_changed(callback):
+    """Register a callback to run after transactions are written"""
+    _transaction_listeners.append(callback)
+
+def _notify_transactions_changed():
+    for callback in _transaction_listeners:
+        callback()
+
+def _insert_transaction(cursor, transaction):
     cursor.execute('''
-    DELETE FROM recurring_expenses
-    WHERE id = ? AND user_id = ?
-    ''', (expense_id, user_id))
+    INSERT INTO transactions (user_id, category, amount, created_at, payment_id, payment_status, description, source)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        transaction.get("user_id"),
+        transaction["category"],
+        float(transaction["amount"]),
+        transaction["created_at"],
+        transaction.get("payment_id") or None,
+        transaction.get("payment_status"),
+        transaction.get("description", ""),
+        transaction.get("source")
+    ))
+    return cursor.lastrowid
+
+def rollup_period(date_obj):
+    """Get the ("YYYY-MM", "YYYY-Www") rollup period of a date"""
+    iso_year, iso_week, _ = date_obj.isocalendar()
+    return date_obj.strftime("%Y-%m"), f"{iso_year}-W{iso_week:02d}"
+
+def _rollup_key(transaction):
+    """Get the (user_id, year_month, iso_week, category) bucket of a transaction"""
+    user_id = transaction.get("user_id") or 0
+    try:
+        date_obj = datetime.strptime(str(transaction["created_at"])[:10], "%Y-%m-%d")
+        year_month, week = rollup_period(date_obj)
+    except ValueError:
+        # Undated transactions still count towards the transaction total
+        year_month = ""
+        week = ""
+    return (int(user_id), year_month, week, transaction["category"])
+
+def _update_rollups(cursor, buckets):
+    """Add {key: (total, count)} to the rollups table"""
+    cursor.executemany('''
+    INSERT INTO transaction_rollups (user_id, year_month, iso_week, category, total, count)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, year_month, iso_week, category)
+    DO UPDATE SET total = total + excluded.total, count = count + excluded.count
+    ''', [key + value for key, value in buckets.items()])
+
+def _add_to_buckets(buckets, transaction):
+    key = _rollup_key(transaction)
+    total, count = buckets.get(key, (0.0, 0))
+    buckets[key] = (total + float(transaction["amount"]), count + 1)
+
+def add_transaction(transaction):
+    """Add a transaction and return it with its new id"""
+    return add_transactions([transaction])[0]
+
+def _add_transactions(cursor, transactions):
+    saved = []
+    buckets = {}
+    for transaction in transactions:
+        row = dict(transaction)
+        row["id"] = _insert_transaction(cursor, row)
+        _add_to_buckets(buckets, row)
+        saved.append(row)
+    # Rollups are updated in the same database transaction as the inserts
+    _update_rollups(cursor, buckets)
+    return saved
+
+def add_transactions(transactions):
+    """Add several transactions in a single database transaction"""
+    conn = get_connection()
+    cursor = conn.cursor()
     
-    deleted = cursor.rowcount > 0
-    conn.commit()
-    conn.close()
+    with conn:
+        saved = _add_transactions(cursor, transactions)
+    _notify_transactions_changed()
+    return saved
+
+def get_transactions(user_id=None, source=None):
+    """Get transactions visible to a user (or all of them), oldest first"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    # Transactions without an owner are shared with every user
+    query = "SELECT * FROM transactions WHERE 1 = 1"
+    params = []
+    if user_id is not None:
+        query += " AND (user_id = ? OR user_id IS NULL)"
+        params.append(user_id)
+    if source is not None:
+        query += " AND source = ?"
+        params.append(source)
+    query += " ORDER BY id ASC"
+    
+    cursor.execute(query, params)
+    return [_transaction_from_row(row) for row in cursor.fetchall()]
+
+def get_transactions_stamp():
+    """Get a value that changes whenever transactions are added (they are never updated or deleted)"""
+    cursor = get_connection().cursor()
+    cursor.execute("SELECT MAX(id) FROM transactions")
+    return cursor.fetchone()[0]
+
+def read_transactions_frame():
+    """Load every transaction into a typed pandas DataFrame, ordered by id"""
+    import pandas as pd
+    
+    frame = pd.read_sql_query("SELECT * FROM transactions ORDER BY id ASC", get_connection())
+    frame["user_id"] = frame["user_id"].astype("Int64")
+    return frame
+
+def frame_to_transactions(frame):
+    """Turn rows of read_transactions_frame() into transaction records"""
+    import pandas as pd
+    
+    transactions = []
+    for row in frame.to_dict(orient="records"):
+        row = {key: (None if pd.isna(value) else value) for key, value in row.items()}
+        if row["user_id"] is not None:
+            row["user_id"] = int(row["user_id"])
+        transactions.append(_transaction_from_row(row))
+    return transactions
+
+def get_transactions_page(user_id=None, limit=50, after=None, category=None,
+                          status=None, source=None, start_date=None, end_date=None):
+    """
+    Get one page of transactions, newest first, using keyset pagination.
+    
+    after is the (created_at, id) of the last row of the previous page and
+    limit=None returns every matching row.
+    Returns (transactions, next_after, total) where next_after is None on the
+    last page and total counts every matching row.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    conditions = []
+    params = []
+    if user_id is not None:
+        # Transactions without an owner are shared with every user
+        conditions.append("(user_id = ? OR user_id IS NULL)")
+        params.append(user_id)
+    if category:
+        conditions.append("category = ?")
+        params.append(category)
+    if status:
+        conditions.append("payment_status = ?")
+        params.append(status)
+    if source:
+        conditions.append("source = ?")
+        params.append(source)
+    if start_date:
+        conditions.append("created_at >= ?")
+        params.append(start_date)
+    if end_date:
+        # end_date is an inclusive day; timestamps on that day sort after it
+        conditions.append("substr(created_at, 1, 10) <= ?")
+        params.append(end_date)
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+    
+    cursor.execute("SELECT COUNT(*) FROM transactions" + where, params)
+    total = cursor.fetchone()[0]
+    
+    page_conditions = list(conditions)
+    page_params = list(params)
+    if after is not None:
+        page_conditions.append("(created_at < ? OR (created_at = ? AND id < ?))")
+        page_params.extend([after[0], after[0], after[1]])
+    page_where = " WHERE " + " AND ".join(page_conditions) if page_conditions else ""
+    
+    cursor.execute(
+        "SELECT * FROM transactions" + page_where + " ORDER BY created_at DESC, id DESC LIMIT ?",
+        page_params + [limit + 1 if limit is not None else -1]
+    )
+    rows = cursor.fetchall()
+    
+    has_more = limit is not None and len(rows) > limit
+    rows = rows[:limit]
+    next_after = (rows[-1]["created_at"], rows[-1]["id"]) if has_more else None
+    
+    return [_transaction_from_row(row) for row in rows], next_after, total
+
+def get_rollup_summary(user_id, year_month, iso_week):
+    """Get (month total, week-within-month total, transaction count) from the rollups"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    query = '''
+    SELECT
+        COALESCE(SUM(CASE WHEN year_month = ? THEN total END), 0),
+        COALESCE(SUM(CASE WHEN year_month = ? AND iso_week = ? THEN total END), 0),
+        COALESCE(SUM(count), 0)
+    FROM transaction_rollups
+    '''
+    params = [year_month, year_month, iso_week]
+    if user_id is not None:
+        # Transactions without an owner are shared with every user
+        query += " WHERE user_id IN (?, 0)"
+        params.append(user_id)
+    
+    cursor.execute(query, params)
+    monthly_total, weekly_total, count = cursor.fetchone()
+    return monthly_total, weekly_total, count
+
+def get_monthly_category_totals(user_id=None, since=None):
+    """
+    Get (year_month, category, total, count) rows of a user's own spending from the rollups
+    
+    since is the first month ("YYYY-MM") to include.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    query = "SELECT year_month, category, SUM(total) AS total, SUM(count) AS count FROM transaction_rollups WHERE 1 = 1"
+    params = []
+    if user_id is not None:
+        # Only the user's own transactions, not the shared ones without an owner
+        query += " AND user_id = ?"
+        params.append(user_id)
+    if since is not None:
+        query += " AND year_month >= ?"
+        params.append(since)
+    query += " GROUP BY year_month, category ORDER BY year_month"
+    
+    cursor.execute(query, params)
+    return [dict(row) for row in cursor.fetchall()]
+
+def get_rollup_stamp(user_id=None):
+    """Get a (count, total) pair that changes whenever a user's own rollups change"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    query = "SELECT COALESCE(SUM(count), 0), COALESCE(SUM(total), 0) FROM transaction_rollups"
+    params = []
+    if user_id is not None:
+        query += " WHERE user_id = ?"
+        params.append(user_id)
+    
+    cursor.execute(query, params)
+    return tuple(cursor.fetchone())
+
+def has_rollups():
+    """Check whether the rollups table has been populated"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT 1 FROM transaction_rollups LIMIT 1")
+    return cursor.fetchone() is not None
+
+def rebuild_rollups():
+    """Regenerate the rollups table from the raw transactions"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    buckets = {}
+    with conn:
+        for row in cursor.execute("SELECT user_id, category, amount, created_at FROM transactions"):
+            _add_to_buckets(buckets, dict(row))
+        
+        cursor.execute("DELETE FROM transaction_rollups")
+        _update_rollups(cursor, buckets)
+    return len(buckets)
+
+def count_transactions(user_id=None):
+    """Count the transactions visible to a user (or all of them)"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    if user_id is None:
+        cursor.execute("SELECT COUNT(*) FROM transactions")
+    else:
+        cursor.execute("SELECT COUNT(*) FROM transactions WHERE user_id = ? OR user_id IS NULL", (user_id,))
+    return cursor.fetchone()[0]
+
+def get_existing_payment_ids(payment_ids):
+    """Return the subset of payment_ids that are already recorded"""
+    payment_ids = [pid for pid in payment_ids if pid]
+    if not payment_ids:
+        return set()
+    
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    existing = set()
+    # Stay well below SQLite's bound parameter limit
+    for i in range(0, len(payment_ids), 500):
+        chunk = payment_ids[i:i + 500]
+        placeholders = ",".join("?" * len(chunk))
+        cursor.execute(f"SELECT payment_id FROM transactions WHERE payment_id IN ({placeholders})", chunk)
+        existing.update(row[0] for row in cursor.fetchall())
+    
+    return existing
+
+def get_sync_checkpoint(account_id):
+    """Get the sync checkpoint of a Razorpay account, or None before its first sync"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT * FROM razorpay_sync_checkpoints WHERE account_id = ?", (account_id,))
+    row = cursor.fetchone()
+    return dict(row) if row else None
+
+def import_synced_transactions(account_id, transactions, checkpoint=None, imported=None):
+    """
+    Add synced transactions and, if given, advance the account's checkpoint
+    
+    checkpoint is a (last_created_at, last_payment_id) pair; it is written in
+    the same database transaction as the inserts and never moves backwards.
+    imported is the number of transactions the whole sync added (defaults to
+    this batch).
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    with conn:
+        saved = _add_transactions(cursor, transactions) if transactions else []
+        if checkpoint is not None:
+            last_created_at, last_payment_id = checkpoint
+            cursor.execute('''
+            INSERT INTO razorpay_sync_checkpoints (account_id, last_created_at, last_payment_id, synced_at, imported)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (account_id) DO UPDATE SET
+                last_created_at = MAX(last_created_at, excluded.last_created_at),
+                last_payment_id = CASE WHEN excluded.last_created_at >= last_created_at
+                                       THEN excluded.last_payment_id ELSE last_payment_id END,
+                synced_at = excluded.synced_at,
+                imported = imported + excluded.imported
+            ''', (account_id, int(last_created_at), last_payment_id, datetime.now().isoformat(),
+                  len(saved) if imported is None else imported))
+    if saved:
+        _notify_transactions_changed()
+    return saved
+
+def migrate_transactions_from_csv(csv_path):
+    """Import transactions from a legacy CSV file, keeping their ids"""
+    if not os.path.exists(csv_path):
+        print(f"No transactions file found at {csv_path}")
+        return 0
+    
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    imported = 0
+    buckets = {}
+    with conn:
+        with open(csv_path, "r", newline="") as f:
+            for row in csv.DictReader(f):
+                try:
+                    user_id = int(row["user_id"]) if row.get("user_id") else None
+                    cursor.execute('''
+                    INSERT OR IGNORE INTO transactions
+                    (id, user_id, category, amount, created_at, payment_id, payment_status, description, source)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', (
+                        int(row["id"]),
+                        user_id,
+                        row["category"],
+                        float(row["amount"]),
+                        row["created_at"],
+                        row.get("payment_id") or None,
+                        row.get("payment_status") or None,
+                        row.get("description") or "",
+                        row.get("source") or None
+                    ))
+                    if cursor.rowcount:
+                        imported += 1
+                        _add_to_buckets(buckets, {
+                            "user_id": user_id,
+                            "category": row["category"],
+                            "amount": row["amount"],
+                            "created_at": row["created_at"]
+                        })
+                except (KeyError, ValueError) as e:
+                    print(f"Skipping invalid transaction row {row}: {e}")
+        _update_rollups(cursor, buckets)
+        # The legacy file may hold recurring expenses the old job posted
+        if imported:
+            _reconcile_recurring_postings(cursor, datetime.now().isoformat())
+    
+    _notify_transactions_changed()
+    return imported
+
+if __name__ == "__main__":
+    import sys
     
-    return deleted 
\ No newline at end of file
+    if len(sys.argv) >= 2 and sys.argv[1] == "migrate-transactions":
+        csv_path = sys.argv[2] if len(sys.argv) > 2 else "classified_transactions.csv"
+        count = migrate_transactions_from_csv(csv_path)
+        print(f"Imported {count} transactions from {csv_path} into {DB_PATH}")
+    elif len(sys.argv) >= 2 and sys.argv[1] == "rebuild-rollups":
+        count = rebuild_rollups()
+        print(f"Rebuilt {count} rollup rows in {DB_PATH}")
+    elif len(sys.argv) >= 2 and sys.argv[1] == "sweep-sessions":
+        count = sweep_expired_sessions()
+        print(f"Removed {count} expired sessions from {DB_PATH}")
+    else:
+        print("Usage: python database.py migrate-transactions [csv_path]")
+        print("       python database.py rebuild-rollups")
+        print("       python database.py sweep-sessions")
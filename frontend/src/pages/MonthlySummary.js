@@ -49,11 +49,20 @@ function MonthlySummary() {
       setLoading(true);
       setError(null);
       try {
-        // Try to fetch transactions from API with fallback to demo data
+        // Try to fetch this month's category totals from the API with fallback to demo data
         let transactionData = [];
         try {
-          const response = await axios.get('http://localhost:8000/transactions', { timeout: 8000 });
-          transactionData = response.data || [];
+          const { startOfMonth, endOfMonth } = getCurrentMonthRange();
+          const response = await axios.get('http://localhost:8000/aggregates', {
+            params: {
+              granularity: 'month',
+              group_by: 'category',
+              from: formatDate(startOfMonth),
+              to: formatDate(endOfMonth),
+            },
+            timeout: 8000,
+          });
+          transactionData = aggregatesToTransactions(response.data?.series || []);
         } catch (apiError) {
           console.warn('Could not fetch transactions from API, using demo data:', apiError);
           // Use demo transactions as fallback
@@ -97,8 +106,8 @@ function MonthlySummary() {
     fetchData();
   }, [user]);
 
-  // Filter transactions for current month
-  const filterTransactionsForCurrentMonth = (txns) => {
+  // Get the start and end of the current month
+  const getCurrentMonthRange = () => {
     const now = new Date();
     const year = now.getFullYear();
     const month = now.getMonth();
@@ -106,6 +115,31 @@ function MonthlySummary() {
     const startOfMonth = new Date(year, month, 1);
     const endOfMonth = new Date(year, month + 1, 0, 23, 59, 59, 999);
     
+    return { startOfMonth, endOfMonth };
+  };
+
+  // Format a date as YYYY-MM-DD in local time
+  const formatDate = (date) => {
+    const month = String(date.getMonth() + 1).padStart(2, '0');
+    const day = String(date.getDate()).padStart(2, '0');
+    return `${date.getFullYear()}-${month}-${day}`;
+  };
+
+  // Each aggregate point stands in for the transactions it sums up
+  const aggregatesToTransactions = (series) => {
+    return series.map((point, index) => ({
+      id: `agg-${index}`,
+      category: point.category,
+      amount: point.total,
+      count: point.count,
+      created_at: point.start,
+    }));
+  };
+
+  // Filter transactions for current month
+  const filterTransactionsForCurrentMonth = (txns) => {
+    const { startOfMonth, endOfMonth } = getCurrentMonthRange();
+    
     return txns.filter(txn => {
       const txnDate = new Date(txn.created_at);
       return txnDate >= startOfMonth && txnDate <= endOfMonth;
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import {
   Box,
   Typography,
@@ -21,8 +21,14 @@ import { useAuth } from '../context/AuthContext';
 import LimitsSetupDialog from '../components/LimitsSetupDialog';
 import SpendingProgress from '../components/SpendingProgress';
 
+const DEFAULT_PAGE_SIZE = 10;
+
 function Transactions() {
   const [transactions, setTransactions] = useState([]);
+  const [rowCount, setRowCount] = useState(0);
+  const [paginationModel, setPaginationModel] = useState({ page: 0, pageSize: DEFAULT_PAGE_SIZE });
+  // Cursor needed to fetch each page; page 0 starts from the newest transaction
+  const pageCursors = useRef([null]);
   const [open, setOpen] = useState(false);
   const [categories, setCategories] = useState([]);
   const [paymentMethods, setPaymentMethods] = useState([]);
@@ -36,19 +42,64 @@ function Transactions() {
   });
   const [openLimitsDialog, setOpenLimitsDialog] = useState(false);
   const [drawerOpen, setDrawerOpen] = useState(false);
+  // This month's per-category totals for the Budget Status drawer
+  const [monthlySpending, setMonthlySpending] = useState([]);
   const { user } = useAuth();
 
+  // Fetch a single page of transactions using the server-side cursor
+  const fetchPage = async (model) => {
+    const cursor = pageCursors.current[model.page];
+    const response = await axios.get('http://localhost:8000/transactions', {
+      params: { limit: model.pageSize, ...(cursor ? { cursor } : {}) },
+    });
+    setTransactions(response.data?.items || []);
+    setRowCount(response.data?.total || 0);
+    pageCursors.current[model.page + 1] = response.data?.next_cursor || null;
+  };
+
+  // Format a date as YYYY-MM-DD in local time
+  const formatDate = (date) => {
+    const month = String(date.getMonth() + 1).padStart(2, '0');
+    const day = String(date.getDate()).padStart(2, '0');
+    return `${date.getFullYear()}-${month}-${day}`;
+  };
+
+  // Budget utilisation covers the whole month, not just the visible grid page
+  const fetchMonthlySpending = async () => {
+    const now = new Date();
+    const response = await axios.get('http://localhost:8000/aggregates', {
+      params: {
+        granularity: 'month',
+        group_by: 'category',
+        from: formatDate(new Date(now.getFullYear(), now.getMonth(), 1)),
+        to: formatDate(new Date(now.getFullYear(), now.getMonth() + 1, 0)),
+      },
+    });
+    setMonthlySpending((response.data?.series || []).map((point) => ({
+      category: point.category,
+      amount: point.total,
+    })));
+  };
+
+  const handleDrawerOpen = async () => {
+    setDrawerOpen(true);
+    try {
+      await fetchMonthlySpending();
+    } catch (error) {
+      console.error('Error fetching monthly spending:', error);
+    }
+  };
+
   useEffect(() => {
     const fetchData = async () => {
       setLoading(true);
       setError(null);
       try {
-        const [txnResponse, catResponse, methodResponse] = await Promise.all([
-          axios.get('http://localhost:8000/transactions'),
+        const [catResponse, methodResponse] = await Promise.all([
           axios.get('http://localhost:8000/categories'),
           axios.get('http://localhost:8000/payment-methods'),
+          fetchPage({ page: 0, pageSize: DEFAULT_PAGE_SIZE }),
         ]);
-        setTransactions(txnResponse.data || []);
         setCategories(catResponse.data.categories || []);
         setPaymentMethods(methodResponse.data.methods || []);
       } catch (error) {
@@ -62,6 +113,21 @@ function Transactions() {
     fetchData();
   }, []);
 
+  const handlePaginationModelChange = async (model) => {
+    // Cursors are only valid for the page size they were fetched with
+    if (model.pageSize !== paginationModel.pageSize) {
+      pageCursors.current = [null];
+      model = { page: 0, pageSize: model.pageSize };
+    }
+    setPaginationModel(model);
+    try {
+      await fetchPage(model);
+    } catch (error) {
+      console.error('Error fetching transactions:', error);
+      setError('Failed to load transaction data. Please try again later.');
+    }
+  };
+
   const handleOpen = () => setOpen(true);
   const handleClose = () => setOpen(false);
 
@@ -79,8 +145,11 @@ function Transactions() {
       };
       
       await axios.post('http://localhost:8000/add-transaction', transactionData);
-      const response = await axios.get('http://localhost:8000/transactions');
-      setTransactions(response.data || []);
+      // New transactions show up first, so go back to the first page
+      const firstPage = { page: 0, pageSize: paginationModel.pageSize };
+      pageCursors.current = [null];
+      setPaginationModel(firstPage);
+      await fetchPage(firstPage);
       handleClose();
       setNewTransaction({
         category: '',
@@ -125,7 +194,7 @@ function Transactions() {
           <Button 
             variant="outlined" 
             color="secondary" 
-            onClick={() => setDrawerOpen(true)}
+            onClick={handleDrawerOpen}
           >
             Budget Status
           </Button>
@@ -152,8 +221,11 @@ function Transactions() {
         <DataGrid
           rows={transactions}
           columns={columns}
-          pageSize={5}
-          rowsPerPageOptions={[5, 10, 25]}
+          paginationMode="server"
+          rowCount={rowCount}
+          paginationModel={paginationModel}
+          onPaginationModelChange={handlePaginationModelChange}
+          pageSizeOptions={[5, 10, 25]}
           disableSelectionOnClick
           getRowId={(row) => row.id || transactions.indexOf(row)}
           sx={{ border: 'none' }}
@@ -237,7 +309,7 @@ function Transactions() {
             </IconButton>
           </Box>
           <SpendingProgress 
-            transactions={transactions}
+            transactions={monthlySpending}
             onSetLimits={() => {
               setDrawerOpen(false);
               setOpenLimitsDialog(true);
@@ -47,11 +47,20 @@ function WeeklySummary() {
       setLoading(true);
       setError(null);
       try {
-        // Try to fetch transactions from the API
+        // Try to fetch this week's per-day category totals from the API
         let transactionData = [];
         try {
-          const response = await axios.get('http://localhost:8000/transactions', { timeout: 8000 });
-          transactionData = response.data || [];
+          const { startOfWeek, endOfWeek } = getCurrentWeekRange();
+          const response = await axios.get('http://localhost:8000/aggregates', {
+            params: {
+              granularity: 'day',
+              group_by: 'category',
+              from: formatDate(startOfWeek),
+              to: formatDate(endOfWeek),
+            },
+            timeout: 8000,
+          });
+          transactionData = aggregatesToTransactions(response.data?.series || []);
         } catch (apiError) {
           console.warn('Could not fetch transactions from API, using demo data:', apiError);
           // Use demo transactions data as fallback
@@ -92,8 +101,8 @@ function WeeklySummary() {
     fetchData();
   }, [user]);
 
-  // Filter transactions for current week
-  const filterTransactionsForCurrentWeek = (txns) => {
+  // Get the start and end of the current week
+  const getCurrentWeekRange = () => {
     const now = new Date();
     const startOfWeek = new Date(now.setDate(now.getDate() - now.getDay()));
     startOfWeek.setHours(0, 0, 0, 0);
@@ -102,6 +111,31 @@ function WeeklySummary() {
     endOfWeek.setDate(startOfWeek.getDate() + 6);
     endOfWeek.setHours(23, 59, 59, 999);
     
+    return { startOfWeek, endOfWeek };
+  };
+
+  // Format a date as YYYY-MM-DD in local time
+  const formatDate = (date) => {
+    const month = String(date.getMonth() + 1).padStart(2, '0');
+    const day = String(date.getDate()).padStart(2, '0');
+    return `${date.getFullYear()}-${month}-${day}`;
+  };
+
+  // Each aggregate point stands in for the transactions it sums up
+  const aggregatesToTransactions = (series) => {
+    return series.map((point, index) => ({
+      id: `agg-${index}`,
+      category: point.category,
+      amount: point.total,
+      count: point.count,
+      created_at: point.start,
+    }));
+  };
+
+  // Filter transactions for current week
+  const filterTransactionsForCurrentWeek = (txns) => {
+    const { startOfWeek, endOfWeek } = getCurrentWeekRange();
+    
     return txns.filter(txn => {
       const txnDate = new Date(txn.created_at);
       return txnDate >= startOfWeek && txnDate <= endOfWeek;
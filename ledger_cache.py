@@ -0,0 +1,102 @@
+"""
+In-process cache of the parsed transaction ledger for FinFlow.
+
+The ledger is loaded once into a DataFrame and kept in memory until a
+transaction is written: either a writer in this process calls invalidate()
+(e.g. from database.on_transactions_changed) or the stamp callable reports
+a write from another process. The stamp is a cheap value that only changes
+when transactions are added, such as the newest transaction id or, for a
+ledger kept in a file, file_stamp(). Writes to other tables (logins,
+sessions, limits) leave the cache alone. Derived views, such as one user's
+transactions as JSON records, are memoized alongside it and dropped on the
+next change.
+"""
+
+import os
+import threading
+
+MAX_VIEWS = 1024
+
+
+def file_stamp(*paths):
+    """Return a stamp callable for a ledger stored in files: their (mtime, size)."""
+    def stamp():
+        stamps = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                stamps.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                stamps.append(None)
+        return tuple(stamps)
+    return stamp
+
+
+class LedgerCache:
+    """Keep a parsed ledger and its derived views in memory between writes."""
+
+    def __init__(self, loader, stamp=None):
+        """
+        loader: callable returning the ledger as a DataFrame
+        stamp: callable returning a value that changes whenever transactions
+            are written (None to rely on invalidate() alone)
+        """
+        self._loader = loader
+        self._stamp_func = stamp
+        self._lock = threading.RLock()
+        self._frame = None
+        self._stamp = None
+        self._stale = True
+        self._views = {}
+        self.version = 0
+
+    def invalidate(self):
+        """Drop the ledger and its views (call after writing transactions)."""
+        with self._lock:
+            self._stale = True
+
+    def _check(self):
+        """Drop everything if transactions were written since the last check."""
+        stamp = self._stamp_func() if self._stamp_func is not None else None
+        if self._stale or stamp != self._stamp:
+            self._frame = None
+            self._views = {}
+            self._stamp = stamp
+            self._stale = False
+            self.version += 1
+
+    def get(self):
+        """Return the ledger frame, reloading it after a write."""
+        with self._lock:
+            self._check()
+            if self._frame is None:
+                self._frame = self._loader()
+            return self._frame
+
+    def view(self, key, build):
+        """
+        Return build(frame) memoized under key until the ledger changes.
+
+        Views are shared between callers and must be treated as read-only.
+        """
+        with self._lock:
+            frame = self.get()
+            return self._memoize(key, lambda: build(frame))
+
+    def memo(self, key, build):
+        """
+        Return build() memoized under key until the ledger changes.
+
+        For results read straight from the database (e.g. an indexed per-user
+        query) that don't need the full ledger loaded.
+        """
+        with self._lock:
+            self._check()
+            return self._memoize(key, build)
+
+    def _memoize(self, key, build):
+        if key not in self._views:
+            if len(self._views) >= MAX_VIEWS:
+                self._views = {}
+            self._views[key] = build()
+        return self._views[key]
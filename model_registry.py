@@ -0,0 +1,122 @@
+"""
+Keep trained models loaded between requests for FinFlow.
+
+A model is unpickled once and reused until its file changes on disk, at
+which point the next request picks up the new version. Load time and a
+content-based version string are recorded so they can be reported.
+Optionally the model's numpy arrays are memory-mapped (joblib mmap_mode)
+so several worker processes share one copy of them.
+"""
+
+import hashlib
+import os
+import threading
+import time
+import traceback
+import warnings
+from datetime import datetime
+
+# How often (seconds) get() looks at the file's mtime for hot reload
+CHECK_INTERVAL = 2.0
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def _file_version(path):
+    """Short content hash identifying one build of a model file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+class ModelRegistry:
+    """Lazily load a joblib model and reload it when the file changes."""
+
+    def __init__(self, path, mmap_mode=None, check_interval=CHECK_INTERVAL):
+        self.path = path
+        self.mmap_mode = mmap_mode
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._model = None
+        self._stamp = None
+        self._checked_at = 0.0
+
+        self.version = None
+        self.load_seconds = None
+        self.loaded_at = None
+        self.error = None
+
+    def _current_stamp(self):
+        try:
+            stat = os.stat(self.path)
+            return (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            return None
+
+    def _load(self, stamp):
+        import joblib
+
+        started = time.perf_counter()
+        try:
+            with warnings.catch_warnings():
+                # Models pickled by other scikit-learn versions still load
+                warnings.simplefilter("ignore")
+                model = joblib.load(self.path, mmap_mode=self.mmap_mode)
+        except Exception as e:
+            # Keep serving the previous model if the new file is bad
+            print(f"Error loading model from {self.path}: {str(e)}")
+            traceback.print_exc()
+            self.error = str(e)
+            self._stamp = stamp
+            return
+
+        self._model = model
+        self._stamp = stamp
+        self.version = _file_version(self.path)
+        self.load_seconds = time.perf_counter() - started
+        self.loaded_at = datetime.now().isoformat()
+        self.error = None
+        print(f"Loaded model {self.path} version {self.version} in {self.load_seconds:.3f}s")
+
+    def get(self):
+        """Return the current model, or None if the file doesn't exist."""
+        now = time.monotonic()
+        if self._model is not None and now - self._checked_at < self.check_interval:
+            return self._model
+
+        with self._lock:
+            self._checked_at = now
+            stamp = self._current_stamp()
+            if stamp is None:
+                if self._model is not None:
+                    print(f"Model file {self.path} was removed; keeping version {self.version}")
+                return self._model
+            if stamp != self._stamp:
+                self._load(stamp)
+            return self._model
+
+    def info(self):
+        """Describe the loaded model for status endpoints."""
+        return {
+            "path": self.path,
+            "loaded": self._model is not None,
+            "version": self.version,
+            "load_seconds": self.load_seconds,
+            "loaded_at": self.loaded_at,
+            "mmap_mode": self.mmap_mode,
+            "error": self.error
+        }
+
+
+def get_registry(path, mmap_mode=None):
+    """Return the shared registry for a model file (one per absolute path)."""
+    key = os.path.abspath(path)
+    with _registries_lock:
+        if key not in _registries:
+            if mmap_mode is None:
+                mmap_mode = os.getenv("FINFLOW_MODEL_MMAP") or None
+            _registries[key] = ModelRegistry(key, mmap_mode=mmap_mode)
+        return _registries[key]
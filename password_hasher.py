@@ -0,0 +1,129 @@
+"""
+PBKDF2 password hashing off the request threads for FinFlow.
+
+Each hash costs a hundred thousand or more SHA-512 rounds, which is enough to
+pin a web worker during a burst of logins. The work runs in a small process
+pool instead; a semaphore caps how many hashes may be queued or running at
+once, and the waiting/in-flight counts are kept for monitoring.
+
+Hashes are stored as "pbkdf2_sha512$<iterations>$<salt>$<hex digest>" so the
+cost can be raised later: records carry their own parameters and
+needs_rehash() tells login to upgrade old ones. Hashes written before this
+format (64 hex chars of salt followed by the digest, 100000 iterations) still
+verify.
+"""
+
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+ALGORITHM = "pbkdf2_sha512"
+LEGACY_ITERATIONS = 100000
+
+
+def _pbkdf2(password, salt, iterations):
+    """Derive the hex digest (runs in a worker process)."""
+    return hashlib.pbkdf2_hmac('sha512', password.encode('utf-8'),
+                               salt.encode('ascii'), iterations).hex()
+
+
+def parse_hash(stored_password):
+    """Split a stored hash into (iterations, salt, hex digest)."""
+    if stored_password.startswith(ALGORITHM + "$"):
+        _, iterations, salt, digest = stored_password.split("$")
+        return int(iterations), salt, digest
+    # Legacy format: 64 hex chars of salt followed by the digest
+    return LEGACY_ITERATIONS, stored_password[:64], stored_password[64:]
+
+
+class PasswordHasher:
+    """Hash and verify passwords in a capped process pool."""
+
+    def __init__(self, iterations=LEGACY_ITERATIONS, workers=2, max_concurrency=8):
+        """
+        iterations: PBKDF2 rounds for new hashes
+        workers: hashing processes; 0 hashes inline in the calling thread
+        max_concurrency: hashes allowed to be queued or running at once
+        """
+        self.iterations = iterations
+        self.workers = workers
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._pool = None
+
+        self.waiting = 0
+        self.in_flight = 0
+        self.max_waiting = 0
+        self.completed = 0
+        self.total_seconds = 0.0
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None and self.workers > 0:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def _derive(self, password, salt, iterations):
+        """Run one PBKDF2 derivation, waiting for a free slot first."""
+        with self._lock:
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            self._slots.acquire()
+        finally:
+            with self._lock:
+                self.waiting -= 1
+                self.in_flight += 1
+
+        started = time.perf_counter()
+        try:
+            pool = self._get_pool()
+            if pool is None:
+                return _pbkdf2(password, salt, iterations)
+            return pool.submit(_pbkdf2, password, salt, iterations).result()
+        finally:
+            self._slots.release()
+            with self._lock:
+                self.in_flight -= 1
+                self.completed += 1
+                self.total_seconds += time.perf_counter() - started
+
+    def hash(self, password):
+        """Hash a password for storing."""
+        salt = secrets.token_hex(32)
+        digest = self._derive(password, salt, self.iterations)
+        return f"{ALGORITHM}${self.iterations}${salt}${digest}"
+
+    def verify(self, stored_password, provided_password):
+        """Verify a stored password against one provided by user"""
+        iterations, salt, digest = parse_hash(stored_password)
+        return hmac.compare_digest(self._derive(provided_password, salt, iterations), digest)
+
+    def needs_rehash(self, stored_password):
+        """True if the hash uses an old format or different parameters."""
+        if not stored_password.startswith(ALGORITHM + "$"):
+            return True
+        return parse_hash(stored_password)[0] != self.iterations
+
+    def stats(self):
+        """Return queue depth and timing counters for monitoring."""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_concurrency": self.max_concurrency,
+                "waiting": self.waiting,
+                "in_flight": self.in_flight,
+                "max_waiting": self.max_waiting,
+                "completed": self.completed,
+                "avg_ms": self.total_seconds * 1000 / self.completed if self.completed else 0.0
+            }
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
@@ -0,0 +1,367 @@
+"""
+Budget limit predictions for FinFlow.
+
+Every app asks PredictionEngine for spending limits and transaction counts.
+With a trained model available the engine is model-backed: the model
+predicts a (limit, count) pair from a one-hot category plus the monthly
+income, and instead of one model.predict call per category every
+(income, category) pair for a request, or for thousands of users at once,
+is put in a single feature matrix and scored with one call. Without a model
+(or if it fails) the engine falls back to a fixed share of income and a
+fixed count per category, computed for all incomes at once with numpy.
+
+A personal mode instead fits limits to a user's own history: an EWMA of
+their monthly spend and transaction count per category, plus a high-end
+quantile. It reads month x category totals (kept up to date as transactions
+arrive, e.g. the SQLite rollups) rather than re-scanning transactions.
+
+Results are memoized in a bounded LRU cache keyed by (rounded income,
+category set, model version), shared by every prediction endpoint, and each
+result gets an ETag so clients can revalidate without re-downloading.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from model_registry import get_registry
+
+# Categories the model was trained on; its one-hot columns are in sorted order
+CATEGORIES = ['Food', 'Transport', 'Shopping', 'Utilities', 'Entertainment']
+FEATURE_COLUMNS = [f'category_{cat}' for cat in sorted(CATEGORIES)] + ['monthly_income']
+
+# Table-driven fallback: share of monthly income and expected monthly count
+FALLBACK_PERCENTAGES = {
+    'Food': 0.3,
+    'Transport': 0.15,
+    'Shopping': 0.2,
+    'Utilities': 0.25,
+    'Entertainment': 0.1
+}
+FALLBACK_COUNTS = {
+    'Food': 15,         # daily/bi-daily purchases
+    'Transport': 12,    # commute and occasional trips
+    'Shopping': 9,      # bi-weekly purchases
+    'Utilities': 6,     # monthly bills
+    'Entertainment': 3  # occasional recreation
+}
+DEFAULT_PERCENTAGE = 0.1
+DEFAULT_COUNT = 5
+# Bump when the table changes so cached results and ETags are refreshed
+TABLE_VERSION = "table-v1"
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "limit_and_count_predictor.pkl")
+
+# Personal mode: EWMA span and the quantile/window of the "high" estimate, in months
+PERSONAL_EWMA_SPAN = int(os.getenv("FINFLOW_PERSONAL_EWMA_SPAN", "3"))
+PERSONAL_QUANTILE = 0.75
+PERSONAL_WINDOW = 6
+# Only this many months of history (ending at the current month) are fitted
+PERSONAL_HISTORY_MONTHS = int(os.getenv("FINFLOW_PERSONAL_HISTORY_MONTHS", "12"))
+
+MAX_BATCH_SIZE = 10000
+PREDICTION_CACHE_SIZE = int(os.getenv("FINFLOW_PREDICTION_CACHE_SIZE", "4096"))
+
+
+def build_feature_matrix(incomes, categories=CATEGORIES):
+    """
+    Build the model input for every (income, category) pair.
+
+    Rows are ordered income-major: all categories of incomes[0], then all
+    categories of incomes[1], and so on. Categories the model doesn't know
+    get an all-zero one-hot row.
+    """
+    incomes = np.asarray(incomes, dtype=float)
+    one_hot = np.array(
+        [[1.0 if col == f'category_{cat}' else 0.0 for col in FEATURE_COLUMNS[:-1]] for cat in categories]
+    ).reshape(len(categories), len(FEATURE_COLUMNS) - 1)
+
+    features = np.empty((len(incomes) * len(categories), len(FEATURE_COLUMNS)))
+    features[:, :-1] = np.tile(one_hot, (len(incomes), 1))
+    features[:, -1] = np.repeat(incomes, len(categories))
+    return pd.DataFrame(features, columns=FEATURE_COLUMNS)
+
+
+def predict_batch(model, incomes, categories=CATEGORIES):
+    """
+    Predict limits and counts for many incomes with a single model call.
+
+    Returns one list per income of {"category", "limit", "count"} dicts.
+    """
+    if len(incomes) == 0:
+        return []
+
+    predictions = np.asarray(model.predict(build_feature_matrix(incomes, categories)))
+    limits = np.round(predictions[:, 0].astype(float), 2).reshape(len(incomes), len(categories))
+    counts = np.rint(predictions[:, 1].astype(float)).astype(int).reshape(len(incomes), len(categories))
+
+    return _to_records(categories, limits, counts)
+
+
+def table_predict_batch(incomes, categories=CATEGORIES):
+    """Predict limits and counts for many incomes from the fallback table."""
+    if len(incomes) == 0:
+        return []
+
+    percentages = np.array([FALLBACK_PERCENTAGES.get(cat, DEFAULT_PERCENTAGE) for cat in categories])
+    counts = np.array([FALLBACK_COUNTS.get(cat, DEFAULT_COUNT) for cat in categories])
+    limits = np.round(np.outer(np.asarray(incomes, dtype=float), percentages), 2)
+    return _to_records(categories, limits, np.broadcast_to(counts, limits.shape))
+
+
+def _to_records(categories, limits, counts):
+    """Turn (incomes x categories) limit/count arrays into per-income dict lists."""
+    return [
+        [
+            {"category": category, "limit": float(limit), "count": int(count)}
+            for category, limit, count in zip(categories, limit_row, count_row)
+        ]
+        for limit_row, count_row in zip(limits, counts)
+    ]
+
+
+class PredictionCache:
+    """Bounded LRU map from a prediction key to its (read-only) result."""
+
+    def __init__(self, max_entries=PREDICTION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, compute):
+        """Return the cached result for key, calling compute() on a miss."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        # Computed outside the lock; concurrent misses for one key are harmless
+        result = compute()
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+prediction_cache = PredictionCache()
+
+
+def round_income(income):
+    """Incomes are predicted to the nearest rupee so nearby requests share a cache entry."""
+    return float(round(float(income)))
+
+
+def cached_prediction(mode, income, categories, model_version, compute):
+    """
+    Return (result, etag) for a prediction, computing it at most once per key.
+
+    mode separates prediction formulas that must not share entries,
+    model_version is whatever identifies the model (or table) in use, and
+    compute(income) is called with the rounded income on a miss.
+    """
+    income = round_income(income)
+    key = (mode, income, tuple(categories), model_version)
+    result = prediction_cache.get(key, lambda: compute(income))
+    return result, _etag(key)
+
+
+def _etag(key):
+    return hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+
+
+def etag_matches(if_none_match, etag):
+    """True if an If-None-Match header lists etag (weak or strong) or is "*"."""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == f'"{etag}"':
+            return True
+    return False
+
+
+def personal_history_start(current_month=None):
+    """First month ("YYYY-MM") of the history window personal_predict uses."""
+    current_month = current_month or datetime.now().strftime("%Y-%m")
+    return (pd.Period(current_month, freq="M") - PERSONAL_HISTORY_MONTHS).strftime("%Y-%m")
+
+
+def personal_predict(history, categories=CATEGORIES, income=None, current_month=None):
+    """
+    Fit per-category limits and counts to one user's monthly history.
+
+    history has year_month ("YYYY-MM"), category, total and count columns
+    (one row per month and category with spending). Only the last
+    PERSONAL_HISTORY_MONTHS months are used. The current month is incomplete
+    and only used when there is nothing older. Months without spending count
+    as zero, from each category's first month in the window on. Categories without
+    spending in the window fall back to the income table when income is given
+    (else zeros). Every result has "category", "limit", "count" and "high",
+    the PERSONAL_QUANTILE of the last PERSONAL_WINDOW months.
+    """
+    current_month = current_month or datetime.now().strftime("%Y-%m")
+    history = pd.DataFrame(history, columns=["year_month", "category", "total", "count"])
+    history = history[history["year_month"].astype(str).str.fullmatch(r"\d{4}-\d{2}")]
+    history = history[(history["year_month"] >= personal_history_start(current_month))
+                      & (history["year_month"] <= current_month)
+                      & (history["count"] > 0)]
+
+    complete = history[history["year_month"] < current_month]
+    if complete.empty:
+        complete = history
+        last_month = pd.Period(current_month, freq="M")
+    else:
+        last_month = pd.Period(current_month, freq="M") - 1
+
+    if income:
+        # Table rows have no spread, so their high end is the limit itself
+        fallback = [dict(row, high=row["limit"]) for row in table_predict_batch([income], categories)[0]]
+    else:
+        fallback = [{"category": cat, "limit": 0.0, "count": 0, "high": 0.0} for cat in categories]
+    if complete.empty:
+        return fallback
+
+    months = pd.period_range(pd.Period(complete["year_month"].min(), freq="M"), last_month, freq="M").strftime("%Y-%m")
+
+    def monthly(column):
+        return (
+            complete.pivot_table(index="year_month", columns="category", values=column, aggfunc="sum")
+            .reindex(index=months, columns=list(categories))
+            .fillna(0)
+            .astype(float)
+        )
+
+    # Each category's series starts at its first month with spending, so
+    # months before a user ever spent on it don't drag its estimate down
+    counts = monthly("count")
+    started = (counts > 0).cummax()
+    totals = monthly("total").where(started)
+    counts = counts.where(started)
+    typical = totals.ewm(span=PERSONAL_EWMA_SPAN).mean().iloc[-1]
+    typical_count = counts.ewm(span=PERSONAL_EWMA_SPAN).mean().iloc[-1]
+    high = totals.tail(PERSONAL_WINDOW).quantile(PERSONAL_QUANTILE)
+    seen = started.iloc[-1]
+
+    results = []
+    for i, category in enumerate(categories):
+        if seen[category]:
+            results.append({
+                "category": category,
+                "limit": round(float(typical[category]), 2),
+                "count": int(round(float(typical_count[category]))),
+                "high": round(max(float(high[category]), float(typical[category])), 2)
+            })
+        else:
+            results.append(fallback[i])
+    return results
+
+
+def cached_personal_prediction(owner, history_stamp, load_history, income=None, categories=CATEGORIES):
+    """
+    Return (result, etag) of personal_predict for one user, cached per user.
+
+    history_stamp must change whenever the user's history does (e.g. a
+    transaction count); load_history() is only called on a miss.
+    """
+    current_month = datetime.now().strftime("%Y-%m")
+    income = round_income(income) if income else None
+    key = ("personal", owner, history_stamp, current_month, tuple(categories), income)
+    result = prediction_cache.get(
+        key, lambda: personal_predict(load_history(), categories, income, current_month)
+    )
+    return result, _etag(key)
+
+
+class PredictionEngine:
+    """Model-backed predictions with a table-driven fallback."""
+
+    def __init__(self, model_path=DEFAULT_MODEL_PATH):
+        self.registry = get_registry(model_path) if model_path else None
+
+    def _model(self):
+        return self.registry.get() if self.registry is not None else None
+
+    @property
+    def model_version(self):
+        """Version of the model in use, or the table version in fallback mode."""
+        if self._model() is not None:
+            return self.registry.version
+        return TABLE_VERSION
+
+    def predict_many(self, incomes, categories=CATEGORIES):
+        """
+        Predict for many incomes at once.
+
+        Returns (results, mode) where mode is "model" or "table" and results
+        holds one list of {"category", "limit", "count"} dicts per income.
+        """
+        model = self._model()
+        if model is not None:
+            try:
+                return predict_batch(model, incomes, categories), "model"
+            except Exception as e:
+                print(f"Model prediction failed, using fallback table: {str(e)}")
+        return table_predict_batch(incomes, categories), "table"
+
+    def predict(self, income, categories=CATEGORIES):
+        """
+        Predict for one income, memoized per (income, categories, model version).
+
+        Returns (results, etag); results are shared and must be treated as read-only.
+        Results are cached under the version that actually produced them, so a
+        fallback after a model error is never served as the model's answer.
+        """
+        model = self._model()
+        if model is not None:
+            try:
+                return cached_prediction(
+                    "limits", income, categories, self.registry.version,
+                    lambda income: predict_batch(model, [income], categories)[0]
+                )
+            except Exception as e:
+                print(f"Model prediction failed, using fallback table: {str(e)}")
+        return cached_prediction(
+            "limits", income, categories, TABLE_VERSION,
+            lambda income: table_predict_batch([income], categories)[0]
+        )
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(model_path=DEFAULT_MODEL_PATH):
+    """Return the shared engine for a model file."""
+    key = os.path.abspath(model_path) if model_path else None
+    with _engines_lock:
+        if key not in _engines:
+            _engines[key] = PredictionEngine(model_path)
+        return _engines[key]
@@ -1,118 +1,124 @@
 #!/usr/bin/env python3
 """
 Process recurring expenses for FinFlow
-This script checks for recurring expenses that are due today and adds them to the transactions
-Run as a daily scheduled task for automatic expense tracking
+This script posts every recurring expense whose next_due date has arrived, including
+occurrences missed while it wasn't running, and moves it to the next month.
+Runs are idempotent, so it can run as a daily scheduled task, with --loop as a
+long-lived process, or inside the web app via start_scheduler()
+
+Users can be split into shards by user id (user_id % N): --shard i/N processes
+one shard, --workers N spreads shards over a process pool. Shards must run as
+processes on the same host as finflow.db: the ledger uses SQLite's WAL mode,
+which needs shared memory and is unsafe on network filesystems
 """
 
-import csv
 import os
-import json
-import sqlite3
-from datetime import datetime, timedelta
+import time
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import database
 
 # Paths
-CSV_PATH = "classified_transactions.csv"
-DB_PATH = "finflow.db"
+DB_PATH = database.DB_PATH
 
-def read_csv():
-    """Read the transactions CSV file"""
-    transactions = []
+def parse_shard(value):
+    """Parse "i/N" into (i, N)"""
     try:
-        with open(CSV_PATH, "r", newline="") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                transactions.append(row)
-    except Exception as e:
-        print(f"Error reading CSV: {e}")
-    return transactions
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("shard must look like i/N, e.g. 0/4")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError("shard index must be between 0 and N-1")
+    return index, count
 
-def write_transaction(user_id, name, category, amount):
-    """Add a transaction to the CSV file"""
-    transactions = read_csv()
-    
-    # Generate new ID
-    new_id = max([int(txn["id"]) for txn in transactions]) + 1 if transactions else 1
+def split_shard(shard, workers):
+    """Split one (i, N) shard into `workers` shards of the same users"""
+    index, count = shard or (0, 1)
+    # user_id % (N * W) == i + N * k implies user_id % N == i
+    return [(index + count * k, count * workers) for k in range(workers)]
+
+def process_expenses(shard=None):
+    """Process expenses that are due today"""
+    if not os.path.exists(DB_PATH):
+        print("Database not found")
+        return 0
     
-    # Create new transaction
-    now = datetime.now().strftime("%Y-%m-%d")
-    new_transaction = {
-        "id": new_id,
-        "category": category,
-        "amount": amount,
-        "created_at": now,
-        "payment_id": "",
-        "payment_status": "recurring",
-        "description": f"Recurring: {name}",
-        "source": "recurring",
-        "user_id": user_id
-    }
+    label = f"Shard {shard[0]}/{shard[1]}: " if shard else ""
+    started = time.perf_counter()
+    posted = database.process_due_recurring_expenses(shard=shard)
     
-    # Append to CSV
-    with open(CSV_PATH, "a", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=["id", "category", "amount", "created_at", "payment_id", "payment_status", "description", "source", "user_id"])
-        if os.path.getsize(CSV_PATH) == 0:
-            writer.writeheader()
-        writer.writerow(new_transaction)
+    # Listing every row would dominate the run time for large batches
+    for transaction in posted[:20]:
+        print(f"Processed recurring expense: {transaction['description'][len('Recurring: '):]} (₹{transaction['amount']})")
+    if len(posted) > 20:
+        print(f"... and {len(posted) - 20} more")
     
-    return new_transaction
+    print(f"{label}Total processed: {len(posted)} in {time.perf_counter() - started:.2f}s")
+    return len(posted)
+
+def _run_shard(shard):
+    """Worker process entry point"""
+    started = time.perf_counter()
+    count = len(database.process_due_recurring_expenses(shard=shard))
+    return shard, count, time.perf_counter() - started
 
-def get_recurring_expenses():
-    """Get recurring expenses from all users"""
+def process_in_parallel(workers, shard=None):
+    """Process the shards of `shard` (or all users) across a pool of worker processes"""
     if not os.path.exists(DB_PATH):
         print("Database not found")
-        return []
+        return 0
     
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    started = time.perf_counter()
+    shards = split_shard(shard, workers)
+    total = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_run_shard, sub_shard) for sub_shard in shards]
+        for done, future in enumerate(as_completed(futures), start=1):
+            (index, count), posted, seconds = future.result()
+            total += posted
+            print(f"[{done}/{len(shards)}] Shard {index}/{count}: {posted} processed in {seconds:.2f}s")
     
-    try:
-        cursor.execute("SELECT id, monthly_income FROM users")
-        users = cursor.fetchall()
-        
-        all_expenses = []
-        for user in users:
-            user_id = user["id"]
-            
-            # Get recurring expenses from recurring_expenses table
-            cursor.execute("SELECT * FROM recurring_expenses WHERE user_id = ?", (user_id,))
-            expenses = cursor.fetchall()
-            
-            for expense in expenses:
-                all_expenses.append(dict(expense))
-        
-        return all_expenses
-    except sqlite3.OperationalError:
-        # Table doesn't exist yet
-        return []
-    finally:
-        conn.close()
+    print(f"Total processed: {total} in {time.perf_counter() - started:.2f}s with {workers} workers")
+    return total
 
-def process_expenses():
-    """Process expenses that are due today"""
-    today = datetime.now().strftime("%Y-%m-%d")
-    day_of_month = datetime.now().day
-    
-    expenses = get_recurring_expenses()
-    processed = 0
-    
-    for expense in expenses:
-        # Check if this expense should be processed today
-        if int(expense["day_of_month"]) == day_of_month:
-            # Add transaction
-            write_transaction(
-                expense["user_id"],
-                expense["name"],
-                expense["category"],
-                expense["amount"]
-            )
-            processed += 1
-            print(f"Processed recurring expense: {expense['name']} (₹{expense['amount']})")
-    
-    print(f"Total processed: {processed}")
+def run_forever(interval, shard=None, workers=1):
+    """Process due expenses now and then every interval seconds"""
+    while True:
+        try:
+            if workers > 1:
+                process_in_parallel(workers, shard)
+            else:
+                process_expenses(shard)
+        except Exception as e:
+            # Postings are all or nothing: a failed run leaves at most its unfinished
+            # recurring_runs row behind, and the next run picks the same expenses up
+            print(f"Error processing recurring expenses: {e}")
+        finally:
+            database.release_connection()
+        time.sleep(interval)
+
+def start_scheduler(interval):
+    """Run the recurring job in a daemon thread of the current process"""
+    thread = threading.Thread(target=run_forever, args=(interval,), name="recurring-scheduler", daemon=True)
+    thread.start()
+    return thread
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Post due recurring expenses")
+    parser.add_argument("--loop", action="store_true", help="keep running and check again every --interval seconds")
+    parser.add_argument("--interval", type=int, default=3600, help="seconds between runs with --loop (default 3600)")
+    parser.add_argument("--shard", type=parse_shard, help="only process users with user_id %% N == i, given as i/N")
+    parser.add_argument("--workers", type=int, default=1, help="split the work over this many processes")
+    args = parser.parse_args()
+    
     print("FinFlow - Processing recurring expenses")
     print(f"Date: {datetime.now().strftime('%Y-%m-%d')}")
-    process_expenses() 
\ No newline at end of file
+    if args.loop:
+        run_forever(args.interval, args.shard, args.workers)
+    elif args.workers > 1:
+        process_in_parallel(args.workers, args.shard)
+    else:
+        process_expenses(args.shard)
@@ -0,0 +1,122 @@
+"""
+Incremental Razorpay payment sync for FinFlow.
+
+Each connected account keeps a high-water mark: the newest payment
+created_at seen by its last complete sync. A sync asks client.payment.all
+only for payments created since then (minus SYNC_OVERLAP seconds, for
+payments that show up late), paging with count/skip until a short page.
+Each page is checked against the payment_id index so only new payments are
+classified and bulk-inserted, FLUSH_SIZE rows per database transaction.
+
+Razorpay returns the newest payments first, so the checkpoint only advances
+once every page has been read and saved; an interrupted sync simply starts
+over from the old checkpoint and skips what it already imported.
+"""
+
+import os
+import time
+from datetime import datetime
+
+import database
+from transaction_classifier import get_classifier
+
+# Razorpay caps count at 100 payments per request
+PAGE_SIZE = 100
+SYNC_OVERLAP = int(os.getenv("FINFLOW_RAZORPAY_SYNC_OVERLAP", "300"))  # seconds
+FLUSH_SIZE = 1000
+
+
+def iter_payment_pages(client, since=None, page_size=PAGE_SIZE):
+    """Yield pages (lists) of payments created at or after since, newest first."""
+    skip = 0
+    while True:
+        params = {"count": page_size, "skip": skip}
+        if since:
+            params["from"] = int(since)
+        response = client.payment.all(params)
+        if not response or "items" not in response:
+            raise ValueError("No payments data received from Razorpay")
+        items = response.get("items") or []
+        if items:
+            yield items
+        if len(items) < page_size:
+            return
+        skip += len(items)
+
+
+def payment_to_transaction(payment, user_id=None):
+    """Turn a Razorpay payment into a transaction record (category may be blank)."""
+    notes = payment.get("notes") or {}
+    return {
+        "user_id": user_id,
+        "category": notes.get("category", "") if isinstance(notes, dict) else "",
+        "amount": float(payment.get("amount", 0)) / 100,  # paise to rupees
+        "created_at": datetime.fromtimestamp(payment.get("created_at", 0)).strftime("%Y-%m-%d"),
+        "payment_id": payment.get("id"),
+        "payment_status": payment.get("status"),
+        "description": payment.get("description") or "",
+        "source": "razorpay"
+    }
+
+
+def _classify(transactions):
+    """Fill in the category of uncategorized transactions in one batch."""
+    uncategorized = [txn for txn in transactions if not txn["category"]]
+    if uncategorized:
+        labels = get_classifier().classify([txn["description"] for txn in uncategorized])
+        for txn, label in zip(uncategorized, labels):
+            txn["category"] = label
+
+
+def sync_payments(client, account_id, user_id=None, page_size=PAGE_SIZE):
+    """
+    Import the account's payments created since its checkpoint.
+
+    Returns a summary dict: pages and payments fetched, transactions
+    imported, the checkpoint used and the new one.
+    """
+    started = time.perf_counter()
+    checkpoint = database.get_sync_checkpoint(account_id)
+    last_created_at = checkpoint["last_created_at"] if checkpoint else 0
+    last_payment_id = checkpoint["last_payment_id"] if checkpoint else None
+    since = max(last_created_at - SYNC_OVERLAP, 0) if checkpoint else None
+
+    pages = 0
+    fetched = 0
+    imported = 0
+    pending = []
+    seen = set()
+    newest = (last_created_at, last_payment_id)
+
+    for page in iter_payment_pages(client, since, page_size):
+        pages += 1
+        fetched += len(page)
+        for payment in page:
+            created_at = int(payment.get("created_at") or 0)
+            if created_at > newest[0]:
+                newest = (created_at, payment.get("id"))
+
+        # Skip skip-shifted repeats within this sync and payments already imported
+        page = [p for p in page if p.get("id") and p.get("id") not in seen]
+        seen.update(p["id"] for p in page)
+        existing = database.get_existing_payment_ids([p["id"] for p in page])
+        new_transactions = [payment_to_transaction(p, user_id) for p in page if p["id"] not in existing]
+        _classify(new_transactions)
+        pending.extend(new_transactions)
+
+        if len(pending) >= FLUSH_SIZE:
+            imported += len(database.import_synced_transactions(account_id, pending))
+            pending = []
+
+    # The last batch and the new checkpoint are written together
+    imported += len(pending)
+    database.import_synced_transactions(account_id, pending, checkpoint=newest, imported=imported)
+
+    return {
+        "pages": pages,
+        "fetched": fetched,
+        "imported": imported,
+        "since": since,
+        "checkpoint": newest[0],
+        "seconds": round(time.perf_counter() - started, 3)
+    }
@@ -0,0 +1,93 @@
+"""
+In-memory cache of session token lookups for FinFlow.
+
+Resolving a session token means joining users and sessions in SQLite, and
+the Flask app does it on nearly every API call. Recently seen tokens are kept
+here for a short TTL so repeat requests skip the database. Tokens are stored
+hashed, the least recently used entry is evicted when the cache is full, and
+hit/miss counters are kept for monitoring.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def hash_token(token):
+    """Hash a session token so raw tokens never sit in memory as keys."""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class SessionCache:
+    """TTL + LRU map from session token to the user it belongs to."""
+
+    def __init__(self, ttl=60, max_entries=10000):
+        """
+        ttl: seconds a cached lookup stays valid
+        max_entries: number of tokens kept before the oldest is evicted
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # token hash -> (user dict, expires at)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, token):
+        """Return a copy of the cached user for token, or None."""
+        key = hash_token(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry[0])
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, token, user, ttl=None):
+        """Cache user for token; ttl can shorten the entry (e.g. session expiry)."""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        key = hash_token(token)
+        with self._lock:
+            self._entries[key] = (dict(user), time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_token(self, token):
+        """Forget one token (call on logout)."""
+        with self._lock:
+            self._entries.pop(hash_token(token), None)
+
+    def invalidate_user(self, user_id):
+        """Forget every token of a user (call after changing the user's row)."""
+        with self._lock:
+            stale = [key for key, (user, _) in self._entries.items() if user.get("id") == user_id]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return counters for monitoring."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
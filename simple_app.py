@@ -1,5 +1,4 @@
 from flask import Flask, render_template, jsonify, request, redirect, url_for, make_response
-import csv
 import os
 import json
 from datetime import datetime
@@ -7,6 +6,13 @@ import uuid
 import random
 import base64
 import database  # Import our database module
+import process_recurring
+import razorpay_sync
+from ledger_cache import LedgerCache
+from prediction_engine import get_engine, cached_personal_prediction, personal_history_start, prediction_cache
+from transaction_classifier import get_classifier
+# Same cursor format and page size limit as the FastAPI backend
+from backend.pagination import encode_cursor, decode_cursor, MAX_PAGE_SIZE
 
 # Sample Razorpay integration
 # In a production app, you would use the actual Razorpay SDK
@@ -40,38 +46,52 @@ if razorpay_available:
     except Exception as e:
         print(f"Error initializing Razorpay: {e}")
 
-# Create CSV if it doesn't exist
-if not os.path.exists(CSV_PATH):
-    with open(CSV_PATH, "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(["id", "category", "amount", "created_at", "payment_id", "payment_status", "description", "source", "user_id"])
-
-# Helper function to read CSV
-def read_csv(user_id=None):
-    transactions = []
+# Import transactions from the legacy CSV the first time the app runs
+if os.path.exists(CSV_PATH) and database.count_transactions() == 0:
+    imported = database.migrate_transactions_from_csv(CSV_PATH)
+    print(f"Imported {imported} transactions from {CSV_PATH}")
+
+# Build summary rollups for databases created before they existed
+if not database.has_rollups() and database.count_transactions() > 0:
+    database.rebuild_rollups()
+
+# Delete expired sessions periodically so token lookups stay fast
+database.start_session_sweeper()
+
+# Post recurring expenses from inside the app (0 disables it, e.g. when the
+# scheduled task or "process_recurring.py --loop" runs instead)
+RECURRING_INTERVAL = int(os.getenv("FINFLOW_RECURRING_INTERVAL", "3600"))
+if RECURRING_INTERVAL > 0:
+    process_recurring.start_scheduler(RECURRING_INTERVAL)
+
+# Parsed ledger kept in memory until transactions are written, by this
+# process or another one (e.g. process_recurring.py); other writes such as
+# logins don't touch it
+ledger = LedgerCache(database.read_transactions_frame, database.get_transactions_stamp)
+database.on_transactions_changed(ledger.invalidate)
+
+# Give the request's database connection back to the pool when it ends
+@app.teardown_request
+def release_db_connection(exc):
+    database.release_connection()
+
+# Helper function to read transactions
+def read_transactions(user_id=None):
     try:
-        with open(CSV_PATH, "r", newline="") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                # Filter by user_id if provided
-                if user_id is not None and 'user_id' in row and row['user_id'] and int(row['user_id']) != user_id:
-                    continue
-                    
-                transaction = {
-                    "id": int(row["id"]),
-                    "category": row["category"],
-                    "amount": float(row["amount"]),
-                    "created_at": row["created_at"]
-                }
-                # Add optional fields if they exist
-                for field in ["payment_id", "payment_status", "description", "source", "user_id"]:
-                    if field in row and row[field]:
-                        transaction[field] = row[field]
-                    
-                transactions.append(transaction)
+        if user_id is None:
+            return ledger.view("records", database.frame_to_transactions)
+        # One user's rows come from the (user_id, created_at) index
+        return ledger.memo(("records", user_id), lambda: database.get_transactions(user_id))
     except Exception as e:
-        print(f"Error reading CSV: {e}")
-    return transactions
+        print(f"Error reading transactions: {e}")
+        return []
+
+def project_fields(transactions, fields):
+    """Keep only the requested comma separated fields (plus id)"""
+    if not fields:
+        return transactions
+    wanted = {"id"} | {name.strip() for name in fields.split(",") if name.strip()}
+    return [{key: value for key, value in txn.items() if key in wanted} for txn in transactions]
 
 # Get current user from cookie
 def get_current_user():
@@ -176,23 +196,23 @@ def api_signup():
     if not user_id:
         return jsonify({"success": False, "message": "Email already registered"}), 400
     
-    # Log the user in
-    user = database.login_user(email, password)
+    # Log the user in; the password was just hashed, so skip verifying it again
+    token = database.create_session(user_id)
     
     # Set cookie
     response = jsonify({
         "success": True,
         "message": "Account created successfully",
         "user": {
-            "email": user["email"],
-            "full_name": user["full_name"],
-            "monthly_income": user["monthly_income"]
+            "email": email,
+            "full_name": full_name,
+            "monthly_income": monthly_income
         }
     })
     
     # Set secure cookie (in production, add secure=True, httponly=True)
     response.set_cookie(
-        'session_token', user["token"], 
+        'session_token', token, 
         max_age=30*24*60*60, # 30 days
         path='/'
     )
@@ -258,6 +278,17 @@ def api_me():
         }
     })
 
+@app.route("/api/metrics", methods=["GET"])
+def api_metrics():
+    """Cache counters for monitoring"""
+    return jsonify({
+        "session_cache": database.session_cache.stats(),
+        "password_hasher": database.password_hasher.stats(),
+        "prediction_cache": prediction_cache.stats(),
+        "classifier": get_classifier().stats(),
+        "db_pool": database.get_pool().stats()
+    })
+
 @app.route("/api/update-limit", methods=["POST"])
 def update_limit():
     user = get_current_user()
@@ -282,32 +313,14 @@ def summary():
     user = get_current_user()
     user_id = user["id"] if user else None
     
-    transactions = read_csv(user_id)
-    now = datetime.now()
-    current_month = now.month
-    current_week = now.isocalendar()[1]  # Week number
+    year_month, iso_week = database.rollup_period(datetime.now())
 
-    monthly_spent = 0
-    weekly_spent = 0
-    total_trans = len(transactions)
+    # Read the pre-aggregated rollups instead of scanning every transaction
+    monthly_spent, weekly_spent, total_trans = database.get_rollup_summary(user_id, year_month, iso_week)
     
     # Default budget (client-side will use localStorage value)
     default_budget = user["monthly_limit"] if user and user["monthly_limit"] > 0 else 5000
 
-    for txn in transactions:
-        try:
-            date_str = txn.get("created_at", "")
-            if not date_str:
-                continue
-            date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-        except ValueError:
-            continue
-
-        if date_obj.month == current_month and date_obj.year == now.year:
-            monthly_spent += txn["amount"]
-            if date_obj.isocalendar()[1] == current_week:
-                weekly_spent += txn["amount"]
-
     response = jsonify({
         "monthly_spent": monthly_spent,
         "weekly_spent": weekly_spent,
@@ -328,10 +341,43 @@ def get_transactions():
         user = get_current_user()
         user_id = user["id"] if user else None
         
-        transactions = read_csv(user_id)
+        limit = request.args.get("limit")
+        cursor = request.args.get("cursor")
+        fields = request.args.get("fields")
+        filters = {
+            "category": request.args.get("category"),
+            "status": request.args.get("status"),
+            "source": request.args.get("source"),
+            "start_date": request.args.get("from"),
+            "end_date": request.args.get("to")
+        }
+        
+        # Without limit/cursor keep returning the plain list older clients expect
+        if limit is None and cursor is None:
+            if any(filters.values()):
+                transactions, _, _ = database.get_transactions_page(user_id, None, **filters)
+                transactions.reverse()  # Oldest first, like the unfiltered list
+            else:
+                transactions = read_transactions(user_id)
+            response = jsonify(project_fields(transactions, fields))
+        else:
+            try:
+                limit = int(limit) if limit else 50
+                if limit < 1 or limit > MAX_PAGE_SIZE:
+                    raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+                after = decode_cursor(cursor) if cursor else None
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            
+            # Page through an indexed query instead of loading every row
+            page, next_after, total = database.get_transactions_page(user_id, limit, after, **filters)
+            response = jsonify({
+                "items": project_fields(page, fields),
+                "next_cursor": encode_cursor(*next_after) if next_after else None,
+                "total": total
+            })
         
         # Add cache control headers for offline support
-        response = jsonify(transactions)
         response.headers['Cache-Control'] = 'public, max-age=600'  # 10 minutes
         
         return response
@@ -347,36 +393,27 @@ def add_transaction():
     data = request.json
     category = data.get("category")
     amount = data.get("amount")
+    description = data.get("description", "")
+    
+    if not category and description:
+        # Let the classifier pick the category from the description
+        category = get_classifier().classify_one(description)
     
     if not category or not amount:
         return jsonify({"error": "Missing category or amount"}), 400
     
-    # Read existing transactions
-    transactions = read_csv()
-    
-    # Generate new ID
-    new_id = max([txn["id"] for txn in transactions]) + 1 if transactions else 1
-
-    # Add new transaction
+    # Add new transaction (the database assigns the id)
     now = datetime.now().strftime("%Y-%m-%d")
-    new_row = {
-        "id": int(new_id), 
+    new_row = database.add_transaction({
         "category": category, 
         "amount": float(amount), 
         "created_at": now,
         "payment_id": "",
         "payment_status": "manual",
-        "description": data.get("description", ""),
+        "description": description,
         "source": "manual",
         "user_id": user["id"]
-    }
-    
-    # Append to CSV
-    with open(CSV_PATH, "a", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=["id", "category", "amount", "created_at", "payment_id", "payment_status", "description", "source", "user_id"])
-        if os.path.getsize(CSV_PATH) == 0:
-            writer.writeheader()
-        writer.writerow(new_row)
+    })
 
     return jsonify({"success": True, "message": "Transaction added", "data": new_row})
 
@@ -459,88 +496,17 @@ def sync_razorpay_transactions():
         }), 400
     
     try:
-        # Get existing transactions
-        existing_transactions = read_csv()
-        existing_payment_ids = set(txn.get("payment_id", "") for txn in existing_transactions if "payment_id" in txn and txn["payment_id"])
-        
-        # Fetch payments from Razorpay (in real app, you'd use pagination)
-        payments = client.payment.all({
-            "count": 100,  # Limit to 100 most recent payments
-        })
-        
-        # Check if we have payments data
-        if not payments or "items" not in payments:
-            return jsonify({
-                "success": False,
-                "message": "No payments data received from Razorpay"
-            }), 500
-        
-        # Generate new ID
-        new_id = max([txn["id"] for txn in existing_transactions]) + 1 if existing_transactions else 1
-        
-        # Process payments and add new ones
-        new_transactions = []
-        for payment in payments.get("items", []):
-            payment_id = payment.get("id")
-            
-            # Skip if already imported
-            if payment_id in existing_payment_ids:
-                continue
-                
-            # Get payment details
-            amount = float(payment.get("amount", 0)) / 100  # Convert from paise to rupees
-            status = payment.get("status")
-            created_at = datetime.fromtimestamp(payment.get("created_at", 0)).strftime("%Y-%m-%d")
-            
-            # Determine category based on description or notes
-            description = payment.get("description", "")
-            notes = payment.get("notes", {})
-            category = notes.get("category", "")
-            
-            # If no category found, try to determine from description
-            if not category:
-                description_lower = description.lower()
-                if "food" in description_lower or "restaurant" in description_lower:
-                    category = "Food"
-                elif "transport" in description_lower or "uber" in description_lower or "cab" in description_lower:
-                    category = "Transport"
-                elif "shopping" in description_lower or "store" in description_lower:
-                    category = "Shopping"
-                elif "utility" in description_lower or "bill" in description_lower:
-                    category = "Utilities"
-                elif "movie" in description_lower or "entertainment" in description_lower:
-                    category = "Entertainment"
-                else:
-                    category = "Other"
-            
-            # Create transaction record
-            transaction = {
-                "id": new_id,
-                "category": category,
-                "amount": amount,
-                "created_at": created_at,
-                "payment_id": payment_id,
-                "payment_status": status,
-                "description": description,
-                "source": "razorpay"
-            }
-            
-            new_transactions.append(transaction)
-            existing_payment_ids.add(payment_id)
-            new_id += 1
-            
-        # Save new transactions to CSV
-        if new_transactions:
-            with open(CSV_PATH, "a", newline="") as f:
-                writer = csv.DictWriter(f, fieldnames=["id", "category", "amount", "created_at", "payment_id", "payment_status", "description", "source"])
-                if os.path.getsize(CSV_PATH) == 0:
-                    writer.writeheader()
-                writer.writerows(new_transactions)
+        # Only payments newer than this account's checkpoint are fetched and
+        # imported; they belong to the user running the sync
+        creds = get_razorpay_credentials()
+        user = get_current_user()
+        result = razorpay_sync.sync_payments(client, creds["key_id"], user["id"] if user else None)
         
         return jsonify({
             "success": True,
-            "message": f"Successfully synced {len(new_transactions)} transactions from Razorpay",
-            "count": len(new_transactions)
+            "message": f"Successfully synced {result['imported']} transactions from Razorpay",
+            "count": result["imported"],
+            "sync": result
         })
         
     except Exception as e:
@@ -552,14 +518,13 @@ def sync_razorpay_transactions():
 @app.route("/api/razorpay-transactions", methods=["GET"])
 def get_razorpay_transactions():
     try:
-        # Get all transactions
-        transactions = read_csv()
-        
-        # Filter transactions from Razorpay
-        razorpay_transactions = [txn for txn in transactions if txn.get("source") == "razorpay"]
-        
-        # Sort by created_at date, most recent first
-        razorpay_transactions.sort(key=lambda x: x.get("created_at", ""), reverse=True)
+        # Get transactions imported from Razorpay, most recent first
+        def build(frame):
+            rows = frame[frame["source"] == "razorpay"]
+            transactions = database.frame_to_transactions(rows)
+            transactions.sort(key=lambda x: x.get("created_at", ""), reverse=True)
+            return transactions
+        razorpay_transactions = ledger.view("razorpay", build)
         
         return jsonify(razorpay_transactions)
     except Exception as e:
@@ -621,16 +586,9 @@ def verify_payment():
     # In a real app, verify the payment signature using Razorpay
     # For demo, we'll assume the payment is successful
     
-    # Read existing transactions
-    transactions = read_csv()
-    
-    # Generate new ID
-    new_id = max([txn["id"] for txn in transactions]) + 1 if transactions else 1
-
-    # Add new transaction
+    # Add new transaction (the database assigns the id)
     now = datetime.now().strftime("%Y-%m-%d")
-    new_row = {
-        "id": int(new_id), 
+    new_row = database.add_transaction({
         "category": category, 
         "amount": float(amount), 
         "created_at": now,
@@ -638,14 +596,7 @@ def verify_payment():
         "payment_status": "paid",
         "description": f"Payment for {category}",
         "source": "razorpay-manual"
-    }
-    
-    # Append to CSV
-    with open(CSV_PATH, "a", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=["id", "category", "amount", "created_at", "payment_id", "payment_status", "description", "source"])
-        if os.path.getsize(CSV_PATH) == 0:
-            writer.writeheader()
-        writer.writerow(new_row)
+    })
 
     return jsonify({
         "status": "success",
@@ -668,32 +619,31 @@ def predict():
     except:
         return jsonify({"error": "Invalid income value"}), 400
 
-    # Generate some simple spending recommendations based on income
-    results = []
-    base_values = {
-        "Food": (0.25, 15),
-        "Transport": (0.15, 20),
-        "Shopping": (0.20, 5),
-        "Utilities": (0.20, 4),
-        "Entertainment": (0.10, 8)
-    }
-    
-    for category in CATEGORIES:
-        percent, count = base_values.get(category, (0.1, 5))
-        limit = round(income * percent, 2)
-        count_adj = max(1, round(count * income / 5000))
+    if request.args.get("mode") == "personal":
+        if not user:
+            return jsonify({"error": "Authentication required"}), 401
         
-        results.append({
-            "category": category,
-            "limit": limit,
-            "count": count_adj
-        })
+        # Fitted to the user's own monthly spending; the rollup stamp changes
+        # with every new transaction, so cached results never go stale
+        user_id = user["id"]
+        results, etag = cached_personal_prediction(
+            user_id, database.get_rollup_stamp(user_id),
+            lambda: database.get_monthly_category_totals(user_id, since=personal_history_start()),
+            income, CATEGORIES
+        )
+        response = jsonify(results)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    else:
+        # Same engine as the API server: the trained model if present, else the fallback table
+        results, etag = get_engine().predict(income, CATEGORIES)
 
-    # Add cache control headers for offline support
-    response = jsonify(results)
-    response.headers['Cache-Control'] = 'public, max-age=3600'  # 1 hour
+        # Add cache control headers for offline support
+        response = jsonify(results)
+        response.headers['Cache-Control'] = 'public, max-age=3600'  # 1 hour
+    response.set_etag(etag)
     
-    return response
+    # Answer 304 Not Modified when the client already has this result
+    return response.make_conditional(request)
 
 if __name__ == "__main__":
     # Try to initialize Razorpay client on startup
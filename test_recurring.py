@@ -0,0 +1,107 @@
+"""
+Tests for posting recurring expenses on databases upgraded from the old
+day-of-month job, which posted occurrences without moving next_due.
+
+Run with: python -m pytest test_recurring.py
+"""
+
+from datetime import date
+
+import pytest
+
+import database
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "finflow.db"))
+    database.init_db()
+    yield database
+    database.release_connection()
+
+
+def add_expense(db, user_id, name, day_of_month, next_due, category="Utilities", amount=500.0):
+    conn = db.get_connection()
+    with conn:
+        cursor = conn.execute('''
+        INSERT INTO recurring_expenses (user_id, name, category, amount, day_of_month, next_due, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, name, category, amount, day_of_month, next_due, "2026-01-20T10:00:00"))
+    return cursor.lastrowid
+
+
+def old_job_posts(db, user_id, name, days, category="Utilities", amount=500.0):
+    """Transactions as the old job wrote them: dated the day it ran"""
+    db.add_transactions([{
+        "user_id": user_id,
+        "category": category,
+        "amount": amount,
+        "created_at": day,
+        "payment_id": "",
+        "payment_status": "recurring",
+        "description": f"Recurring: {name}",
+        "source": "recurring"
+    } for day in days])
+
+
+def recurring_rows(db, name):
+    cursor = db.get_connection().execute(
+        "SELECT created_at FROM transactions WHERE description = ? ORDER BY created_at", (f"Recurring: {name}",))
+    return [row[0][:10] for row in cursor.fetchall()]
+
+
+def next_due(db, expense_id):
+    return db.get_connection().execute(
+        "SELECT next_due FROM recurring_expenses WHERE id = ?", (expense_id,)).fetchone()[0]
+
+
+def test_first_run_after_upgrade_does_not_repost(db):
+    expense_id = add_expense(db, 1, "Rent", 5, "2026-02-05")
+    old_job_posts(db, 1, "Rent", [f"2026-{month:02d}-05" for month in range(2, 11)])
+
+    posted = db.process_due_recurring_expenses(today=date(2026, 10, 18))
+
+    assert posted == []
+    assert len(recurring_rows(db, "Rent")) == 9
+    assert next_due(db, expense_id) == "2026-11-05"
+
+    # The next occurrence is posted once, and only once
+    assert len(db.process_due_recurring_expenses(today=date(2026, 11, 6))) == 1
+    assert db.process_due_recurring_expenses(today=date(2026, 11, 7)) == []
+    assert recurring_rows(db, "Rent")[-1] == "2026-11-05"
+
+
+def test_old_posts_after_the_28th_match_capped_due_dates(db):
+    expense_id = add_expense(db, 1, "Gym", 30, "2026-08-28")
+    old_job_posts(db, 1, "Gym", ["2026-08-30", "2026-09-30"])
+
+    assert db.process_due_recurring_expenses(today=date(2026, 10, 18)) == []
+    assert next_due(db, expense_id) == "2026-10-28"
+
+
+def test_expenses_never_posted_are_still_backfilled(db):
+    add_expense(db, 2, "Internet", 10, "2026-08-10")
+    old_job_posts(db, 1, "Internet", ["2026-09-10"])  # another user's expense
+
+    posted = db.process_due_recurring_expenses(today=date(2026, 10, 18))
+
+    assert [txn["created_at"] for txn in posted] == ["2026-08-10", "2026-09-10", "2026-10-10"]
+
+
+def test_importing_old_transactions_reconciles_again(db, tmp_path):
+    expense_id = add_expense(db, 1, "Rent", 5, "2026-11-05")
+    assert db.process_due_recurring_expenses(today=date(2026, 10, 18)) == []
+
+    # The legacy CSV is imported only after the first run
+    with db.get_connection():
+        db.get_connection().execute("UPDATE recurring_expenses SET next_due = '2026-02-05' WHERE id = ?", (expense_id,))
+    csv_path = tmp_path / "classified_transactions.csv"
+    csv_path.write_text(
+        "id,category,amount,created_at,payment_id,payment_status,description,source,user_id\n"
+        + "".join(f"{month},Utilities,500,2026-{month:02d}-05,,recurring,Recurring: Rent,recurring,1\n"
+                  for month in range(2, 11))
+    )
+    assert db.migrate_transactions_from_csv(str(csv_path)) == 9
+
+    assert db.process_due_recurring_expenses(today=date(2026, 10, 18)) == []
+    assert next_due(db, expense_id) == "2026-11-05"
@@ -0,0 +1,187 @@
+"""
+Transaction classification service for FinFlow.
+
+Descriptions are classified in batches by the TensorFlow model from
+backend/classify_data.py, which is loaded once on first use. Single
+descriptions (e.g. a manually added transaction) are queued and grouped
+into micro-batches: a batch runs as soon as BATCH_SIZE descriptions are
+waiting or BATCH_WINDOW seconds after the first one arrived.
+
+Without TensorFlow or the model files the service falls back to keyword
+rules evaluated over the whole batch with NumPy.
+"""
+
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.getenv("FINFLOW_CLASSIFIER_MODEL", os.path.join(BASE_DIR, "models", "transaction_classifier.h5"))
+ENCODER_PATH = os.getenv("FINFLOW_CLASSIFIER_ENCODER", os.path.join(BASE_DIR, "models", "label_encoder.pkl"))
+VOCAB_PATH = os.getenv("FINFLOW_CLASSIFIER_VOCAB", os.path.join(BASE_DIR, "models", "vocab.txt"))
+
+BATCH_SIZE = int(os.getenv("FINFLOW_CLASSIFIER_BATCH_SIZE", "64"))
+BATCH_WINDOW = float(os.getenv("FINFLOW_CLASSIFIER_BATCH_WINDOW", "0.01"))  # seconds
+
+DEFAULT_CATEGORY = "Other"
+
+# Keyword fallback, checked in order; the first category with a match wins
+KEYWORD_RULES = [
+    ("Food", ["food", "restaurant", "swiggy", "zomato", "cafe", "grocer"]),
+    ("Transport", ["transport", "uber", "cab", "fuel", "petrol", "metro"]),
+    ("Shopping", ["shopping", "store", "amazon", "flipkart"]),
+    ("Utilities", ["utility", "bill", "electricity", "water", "recharge", "internet"]),
+    ("Entertainment", ["movie", "entertainment", "netflix", "spotify", "concert"])
+]
+
+
+def keyword_classify(descriptions):
+    """Classify descriptions with KEYWORD_RULES, vectorized over the batch."""
+    if len(descriptions) == 0:
+        return []
+    lowered = np.char.lower(np.asarray([str(d) for d in descriptions], dtype=str))
+    labels = np.full(len(lowered), DEFAULT_CATEGORY, dtype=object)
+    unassigned = np.ones(len(lowered), dtype=bool)
+    for category, keywords in KEYWORD_RULES:
+        matched = np.zeros(len(lowered), dtype=bool)
+        for keyword in keywords:
+            matched |= np.char.find(lowered, keyword) >= 0
+        hit = matched & unassigned
+        labels[hit] = category
+        unassigned &= ~hit
+        if not unassigned.any():
+            break
+    return labels.tolist()
+
+
+class TransactionClassifier:
+    """Load the classifier once and run descriptions through it in batches."""
+
+    def __init__(self, model_path=MODEL_PATH, encoder_path=ENCODER_PATH, vocab_path=VOCAB_PATH,
+                 batch_size=BATCH_SIZE, batch_window=BATCH_WINDOW):
+        self.model_path = model_path
+        self.encoder_path = encoder_path
+        self.vocab_path = vocab_path
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+
+        self._load_lock = threading.Lock()
+        self._loaded = False
+        self._model = None
+        self.backend = None
+
+        self._queue_lock = threading.Condition()
+        self._queue = []
+        self._worker = None
+
+        self.batches = 0
+        self.classified = 0
+
+    def _load(self):
+        """Load the TensorFlow model, encoder and vocabulary (once)."""
+        with self._load_lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            paths = [self.model_path, self.encoder_path, self.vocab_path]
+            if not all(os.path.exists(path) for path in paths):
+                print("Classifier model files not found; using keyword classification")
+                self.backend = "keywords"
+                return
+            try:
+                from backend.classify_data import load_model_and_encoder
+                started = time.perf_counter()
+                self._model = load_model_and_encoder(*paths)
+                self.backend = "tensorflow"
+                print(f"Loaded transaction classifier in {time.perf_counter() - started:.2f}s")
+            except Exception as e:
+                # TensorFlow isn't installed or the model doesn't load
+                print(f"Error loading transaction classifier, using keywords: {str(e)}")
+                self.backend = "keywords"
+
+    def classify(self, descriptions):
+        """Classify a list of descriptions in one model call and return their categories."""
+        descriptions = [str(d) if d is not None else "" for d in descriptions]
+        if not descriptions:
+            return []
+        self._load()
+
+        labels = None
+        if self._model is not None:
+            try:
+                from backend.classify_data import classify_transactions
+                model, label_encoder, vectorizer = self._model
+                labels = [str(label) for label in
+                          classify_transactions(np.asarray(descriptions), model, vectorizer, label_encoder)]
+            except Exception as e:
+                print(f"Error classifying transactions, using keywords: {str(e)}")
+                traceback.print_exc()
+        if labels is None:
+            labels = keyword_classify(descriptions)
+
+        self.batches += 1
+        self.classified += len(descriptions)
+        return labels
+
+    def submit(self, description):
+        """Queue one description for the next micro-batch and return a Future of its category."""
+        future = Future()
+        with self._queue_lock:
+            self._queue.append((description, future))
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="classifier", daemon=True)
+                self._worker.start()
+            self._queue_lock.notify()
+        return future
+
+    def classify_one(self, description):
+        """Classify a single description, batched with concurrent callers."""
+        return self.submit(description).result()
+
+    def _run(self):
+        while True:
+            with self._queue_lock:
+                while not self._queue:
+                    self._queue_lock.wait()
+                # Wait for the batch to fill or the window to close
+                deadline = time.monotonic() + self.batch_window
+                while len(self._queue) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._queue_lock.wait(remaining)
+                batch = self._queue[:self.batch_size]
+                self._queue = self._queue[self.batch_size:]
+
+            try:
+                labels = self.classify([description for description, _ in batch])
+                for (_, future), label in zip(batch, labels):
+                    future.set_result(label)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+    def stats(self):
+        return {
+            "backend": self.backend,
+            "batches": self.batches,
+            "classified": self.classified,
+            "queued": len(self._queue)
+        }
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_classifier():
+    """Return the shared classifier service."""
+    global _classifier
+    with _classifier_lock:
+        if _classifier is None:
+            _classifier = TransactionClassifier()
+        return _classifier